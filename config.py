@@ -1,5 +1,6 @@
 # Configuration parameters for the RAG system
 import os
+import sys
 from dotenv import load_dotenv
 
 # Initialize environment
@@ -14,52 +15,92 @@ REPORTS_DIR = os.path.join(BASE_DIR, 'reports')
 UI_DIR = os.path.join(BASE_DIR, 'ui')
 
 # Threading and model configuration
+# Allow torch and faiss to each load their own OpenMP runtime (macOS workaround)
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
-os.environ['OMP_NUM_THREADS'] = '1'
+# Pin OpenMP to one thread only on macOS (set ALLOW_OMP=1 to opt out);
+# elsewhere let FAISS/BLAS use half the cores unless the user chose a value
+if sys.platform == 'darwin' and not os.environ.get('ALLOW_OMP'):
+    os.environ['OMP_NUM_THREADS'] = '1'
+else:
+    os.environ.setdefault('OMP_NUM_THREADS', str(max(1, (os.cpu_count() or 1) // 2)))
 os.environ['TOKENIZERS_PARALLELISM'] = 'false'
 
 HF_TOKEN = os.getenv('HF_TOKEN')
-CACHE_DIR = os.path.join(BASE_DIR, '.cache', 'huggingface')
+# Reuse the host-wide HuggingFace cache instead of a per-clone copy
+CACHE_DIR = (
+    os.environ.get('HF_HOME')
+    or os.environ.get('TRANSFORMERS_CACHE')
+    or os.path.expanduser(os.path.join('~', '.cache', 'huggingface'))
+)
+os.environ.setdefault('HF_HOME', CACHE_DIR)
 
 # Dataset configuration
 FIXED_URLS_COUNT = 200 #200
 RANDOM_URLS_COUNT = 300 #300
 TOTAL_URLS_COUNT = 500 #500
 MIN_WORDS_PER_PAGE = 200 #200
+COLLECTION_WORKERS = 8  # Concurrent Wikipedia requests during data collection
 
 # File paths
 FIXED_URLS_FILE = os.path.join(DATA_DIR, 'fixed_urls.json')
 CORPUS_FILE = os.path.join(DATA_DIR, 'corpus.pkl')
 CHUNKS_FILE = os.path.join(DATA_DIR, 'chunks.json')
+CHUNKS_PARQUET_FILE = os.path.join(DATA_DIR, 'chunks.parquet')  # Columnar copy (needs pyarrow)
 VECTOR_INDEX_FILE = os.path.join(DATA_DIR, 'faiss_index.bin')
 VECTOR_METADATA_FILE = os.path.join(DATA_DIR, 'faiss_index_metadata.pkl')
-BM25_INDEX_FILE = os.path.join(DATA_DIR, 'bm25_index.pkl')
+BM25_INDEX_FILE = os.path.join(DATA_DIR, 'bm25_index.npz')
+BM25_LEGACY_INDEX_FILE = os.path.join(DATA_DIR, 'bm25_index.pkl')  # Pickled index from older versions (still loadable)
+PIPELINE_STATE_FILE = os.path.join(DATA_DIR, '.pipeline_state.json')  # Stages completed by run_evaluation.py
+FAISS_MMAP = True  # Memory-map the FAISS index on load (IVF indexes; Flat loads normally)
 
 # Chunking settings (from assignment requirements)
 MIN_CHUNK_TOKENS = 200
 MAX_CHUNK_TOKENS = 400
 CHUNK_OVERLAP_TOKENS = 50
+PREPROCESSING_WORKERS = None  # Chunking processes (None = one per CPU core, 1 = serial)
 
 # Model settings
 EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
 EMBEDDING_DIM = 384
+EMBEDDING_QUANT = 'sq8'  # 'sq8' = 8-bit scalar quantization (IVF when large enough), 'hnsw' = HNSW graph over FP32, 'flat' = exact FP32
+FAISS_NLIST = 64  # IVF clusters (needs ~39 training vectors per cluster)
+FAISS_NPROBE = 8  # Clusters scanned per query
+HNSW_M = 32  # Graph neighbours per vector for the 'hnsw' index
+HNSW_EF_CONSTRUCTION = 200  # Candidate list size while building the graph
+HNSW_EF_SEARCH = 64  # Candidate list size per query (higher = better recall, slower)
+HNSW_MIN_VECTORS = 5000  # Smaller corpora use an exact Flat index instead
+EMBEDDING_BATCH_SIZE = 128  # Chunks per encoder forward pass when building the index
+QUERY_BATCH_SIZE = 64  # Queries per encoder forward pass when batch-encoding
+QUERY_CACHE_SIZE = 1024  # Query embeddings kept by DenseRetriever.search
 LLM_MODEL = 'google/flan-t5-base'
 MAX_GEN_LENGTH = 256
-TEMPERATURE = 0.1
+PRECISION = 'bf16'  # LLM weights: 'fp32' | 'bf16' | 'int8' (int8 needs CUDA + bitsandbytes; falls back when unsupported)
+COMPILE_MODEL = False  # torch.compile the LLM forward pass (faster decoding after a one-off compile per shape)
+NUM_BEAMS = 2  # Beam width for answer generation (1 = greedy; each beam multiplies decoder work)
+ANSWER_CACHE_SIZE = 512  # Generated answers kept per (query, retrieved chunks)
+GENERATION_MAX_BATCH = 8  # Concurrent UI requests decoded in one generate() call
+GENERATION_MAX_WAIT_MS = 10  # How long a UI request waits for others to batch with
 
 # Retrieval settings
 DENSE_TOP_K = 10
 SPARSE_TOP_K = 10
+BM25_K1 = 1.5  # BM25 term-frequency saturation (rank_bm25 defaults)
+BM25_B = 0.75  # BM25 document-length normalization
+BM25_EPSILON = 0.25  # idf floor (as a fraction of mean idf) for very common terms
 RRF_K = 60  # From assignment formula: RRF_score(d) = sum(1/(k + rank_i(d)))
 FINAL_TOP_N = 3
 
 # Evaluation settings
+SEED = 42  # Random seed for reproducible sampling
 NUM_QUESTIONS = 100
 QUESTIONS_COUNT = 100  # Total number of questions to generate
+EVAL_CONCURRENCY = int(os.getenv('EVAL_CONCURRENCY', 2))  # Questions answered in parallel by the pipeline
 QUESTIONS_FILE = os.path.join(EVAL_DIR, 'questions_dataset.json')
 RESULTS_FILE = os.path.join(REPORTS_DIR, 'results.json')
 RESULTS_CSV = os.path.join(REPORTS_DIR, 'results.csv')
+RESULTS_JSONL = os.path.join(REPORTS_DIR, 'results.jsonl')  # One result per line, streamed
 EXTENDED_RESULTS = os.path.join(REPORTS_DIR, 'extended_results.json')
+REPORT_DPI = 120  # Resolution of report PNGs (displayed at <= 800px wide in the HTML)
 HTML_REPORT = os.path.join(REPORTS_DIR, 'evaluation_report.html')
 
 # Question distribution by type
@@ -73,12 +114,16 @@ QUESTION_TYPES = {
 # Metrics configuration
 NDCG_K = 3
 MRR_CUTOFF = 10
+DEDUPE_BY_URL = False  # Collapse chunks from the same article before MRR/NDCG (changes ranks)
+SKIP_ROUGE_ON_RETRIEVAL_FAIL = False  # Score ROUGE as 0 when no correct URL was retrieved (MRR = 0)
 
 # UI settings
 UI_HOST = '0.0.0.0'
 UI_PORT = 5000
 UI_DEBUG = True
+UI_CACHE_SIZE = 256  # Full /api/search responses kept by the Flask UI
 
-# Create required directories
-for directory in [DATA_DIR, SRC_DIR, EVAL_DIR, REPORTS_DIR, UI_DIR]:
-    os.makedirs(directory, exist_ok=True)
+def ensure_dirs():
+    """Create required directories (called by entry points, not on import)"""
+    for directory in (DATA_DIR, SRC_DIR, EVAL_DIR, REPORTS_DIR, UI_DIR):
+        os.makedirs(directory, exist_ok=True)
@@ -3,10 +3,10 @@ Evaluation Metrics for RAG System
 Implements MRR (mandatory), NDCG@K, and ROUGE-L (custom metrics)
 """
 
+import functools
 import numpy as np
-from typing import List, Dict, Tuple
-from sklearn.metrics import ndcg_score
-from rouge_score import rouge_scorer
+from typing import List, Dict, Tuple, FrozenSet
+from rouge_score import rouge_scorer, scoring
 import sys
 import os
 
@@ -14,16 +14,88 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
 
 
+def lcs_length(a: List[str], b: List[str]) -> int:
+    """
+    Length of the longest common subsequence of two token lists.
+    
+    Bit-parallel (Hyyro / Allison-Dix): the DP row for the shorter sequence
+    is packed into one Python int, so each token of the longer sequence is a
+    handful of word-parallel AND/ADD/SUB/OR operations instead of a Python
+    loop over the row. LCS = number of zero bits left in the row vector.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return 0
+    
+    # Bitmask of positions in b where each token occurs
+    masks = {}
+    for i, token in enumerate(b):
+        masks[token] = masks.get(token, 0) | (1 << i)
+    
+    full = (1 << len(b)) - 1
+    row = full
+    for token in a:
+        matches = row & masks.get(token, 0)
+        row = ((row + matches) | (row - matches)) & full
+    
+    return len(b) - bin(row).count('1')
+
+
+def score_lcs(target_tokens: List[str], prediction_tokens: List[str]) -> scoring.Score:
+    """ROUGE-L precision/recall/F1 from token lists (same result as rouge_score)."""
+    if not target_tokens or not prediction_tokens:
+        return scoring.Score(precision=0, recall=0, fmeasure=0)
+    
+    lcs = lcs_length(target_tokens, prediction_tokens)
+    precision = lcs / len(prediction_tokens)
+    recall = lcs / len(target_tokens)
+    return scoring.Score(precision=precision, recall=recall, fmeasure=scoring.fmeasure(precision, recall))
+
+
+# ROUGE fields reported for answers that are not scored
+_ZERO_ROUGE = {'precision': 0.0, 'recall': 0.0, 'f1': 0.0, 'rouge1_f1': 0.0, 'rouge2_f1': 0.0}
+
+
+def dedupe_urls(urls) -> List[str]:
+    """Drop repeated URLs, keeping the first (highest-ranked) occurrence."""
+    return list(dict.fromkeys(urls))
+
+
 class EvaluationMetrics:
     """Calculate evaluation metrics for RAG system."""
     
     def __init__(self):
         """Initialize metrics calculator."""
         self.rouge = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
+        
+        # Memoize Porter stemming per word (answers share most of their vocabulary)
+        stemmer = getattr(self.rouge._tokenizer, '_stemmer', None)
+        if stemmer is not None:
+            stemmer.stem = functools.lru_cache(maxsize=200_000)(stemmer.stem)
+        
+        # Tokenized texts persist across batches (reference answers repeat on re-runs)
+        self._tokenize = functools.lru_cache(maxsize=8192)(self.rouge._tokenizer.tokenize)
+        
+        # Constant tables specialized for the configured cutoffs, so the kernels
+        # zip against them instead of dividing/taking logs per rank
+        self._rr_table = self._reciprocal_ranks(config.MRR_CUTOFF)
+        self._discount, self._idcg = self._ndcg_tables(config.NDCG_K)
+    
+    @staticmethod
+    def _reciprocal_ranks(cutoff: int) -> Tuple[float, ...]:
+        """1/rank for ranks 1..cutoff."""
+        return tuple(1.0 / rank for rank in range(1, cutoff + 1))
+    
+    @staticmethod
+    def _ndcg_tables(k: int) -> Tuple[Tuple[float, ...], Tuple[float, ...]]:
+        """Binary-relevance NDCG tables: per-rank discount and ideal DCG by #relevant."""
+        discount = 1.0 / np.log2(np.arange(2, k + 2))
+        return tuple(discount.tolist()), tuple(np.cumsum(discount).tolist())
     
     def calculate_mrr_url(
         self,
-        ground_truth_urls: List[str],
+        ground_truth_urls: FrozenSet[str],
         retrieved_chunks: List[Tuple[Dict, float]],
         cutoff: int = config.MRR_CUTOFF
     ) -> float:
@@ -34,7 +106,7 @@ class EvaluationMetrics:
         Formula: MRR = 1/rank where rank is the position of the first correct URL
         
         Args:
-            ground_truth_urls: List of correct Wikipedia URLs
+            ground_truth_urls: Set of correct Wikipedia URLs
             retrieved_chunks: List of (chunk_dict, score) tuples from retrieval
             cutoff: Maximum rank to consider
             
@@ -50,16 +122,62 @@ class EvaluationMetrics:
         # Extract URLs from retrieved chunks
         retrieved_urls = [chunk['url'] for chunk, _ in retrieved_chunks[:cutoff]]
         
-        # Find rank of first correct URL
-        for rank, url in enumerate(retrieved_urls, 1):
+        return self._mrr_from_urls(ground_truth_urls, retrieved_urls, cutoff)
+    
+    def _mrr_from_urls(self, ground_truth_urls: FrozenSet[str], retrieved_urls: List[str], cutoff: int) -> float:
+        """Reciprocal rank of the first retrieved URL found in the ground truth set."""
+        rr_table = self._rr_table if cutoff == config.MRR_CUTOFF else self._reciprocal_ranks(cutoff)
+        
+        # zip() stops at the cutoff, no slicing or division per rank
+        for reciprocal_rank, url in zip(rr_table, retrieved_urls):
             if url in ground_truth_urls:
-                return 1.0 / rank
+                return reciprocal_rank
         
         return 0.0
     
+    def calculate_mrr_batch(
+        self,
+        ground_truth_urls_list: List[FrozenSet[str]],
+        retrieved_urls_list: List[List[str]],
+        cutoff: int = config.MRR_CUTOFF
+    ) -> np.ndarray:
+        """
+        Calculate URL-level reciprocal ranks for many questions at once.
+        
+        URLs are mapped to integer IDs once, retrieved IDs are packed into an
+        (N, cutoff) matrix, and the first-hit rank of every row is found with
+        a single vectorized scan.
+        
+        Args:
+            ground_truth_urls_list: Correct URLs for each question
+            retrieved_urls_list: Retrieved URLs (in rank order) for each question
+            cutoff: Maximum rank to consider
+            
+        Returns:
+            Array of reciprocal ranks, one per question (0 if not found)
+        """
+        num_questions = len(retrieved_urls_list)
+        url_ids = {}
+        
+        # Encode retrieved URLs; -1 pads rows with fewer than cutoff results
+        retrieved_ids = np.full((num_questions, cutoff), -1, dtype=np.int32)
+        for i, urls in enumerate(retrieved_urls_list):
+            ids = [url_ids.setdefault(url, len(url_ids)) for url in urls[:cutoff]]
+            retrieved_ids[i, :len(ids)] = ids
+        
+        # Mark positions that hold a ground-truth URL
+        hits = np.zeros((num_questions, cutoff), dtype=bool)
+        for i, ground_truth_urls in enumerate(ground_truth_urls_list):
+            gt_ids = [url_ids[url] for url in ground_truth_urls if url in url_ids]
+            if gt_ids:
+                hits[i] = np.isin(retrieved_ids[i], gt_ids)
+        
+        first_hit = hits.argmax(axis=1)
+        return np.where(hits.any(axis=1), 1.0 / (first_hit + 1), 0.0)
+    
     def calculate_ndcg_at_k(
         self,
-        ground_truth_urls: List[str],
+        ground_truth_urls: FrozenSet[str],
         retrieved_chunks: List[Tuple[Dict, float]],
         k: int = config.NDCG_K
     ) -> float:
@@ -84,32 +202,38 @@ class EvaluationMetrics:
             <0.5 = poor ranking (relevant docs buried or missing)
         
         Args:
-            ground_truth_urls: List of correct Wikipedia URLs
+            ground_truth_urls: Set of correct Wikipedia URLs
             retrieved_chunks: List of (chunk_dict, score) tuples
             k: Number of top results to consider
             
         Returns:
             NDCG@K score between 0 and 1
         """
-        # Create relevance scores (1 if URL matches ground truth, 0 otherwise)
-        relevance_scores = []
-        for chunk, _ in retrieved_chunks[:k]:
-            relevance = 1 if chunk['url'] in ground_truth_urls else 0
-            relevance_scores.append(relevance)
+        retrieved_urls = [chunk['url'] for chunk, _ in retrieved_chunks[:k]]
         
-        # If no relevant documents, return 0
-        if sum(relevance_scores) == 0:
-            return 0.0
+        return self._ndcg_from_urls(ground_truth_urls, retrieved_urls, k)
+    
+    def _ndcg_from_urls(self, ground_truth_urls: FrozenSet[str], retrieved_urls: List[str], k: int) -> float:
+        """Binary-relevance NDCG@K over retrieved URLs in rank order."""
+        if k == config.NDCG_K:
+            discount, idcg = self._discount, self._idcg
+        else:
+            discount, idcg = self._ndcg_tables(k)
         
-        # Calculate NDCG using sklearn
-        y_true = np.array([relevance_scores])
-        y_score = np.array([list(range(k, 0, -1))])
+        # Closed form for binary relevance in ranked order:
+        # DCG = sum(rel_i / log2(i + 1)), IDCG = DCG of the num_relevant hits at the top
+        dcg = 0.0
+        num_relevant = 0
+        for rank_discount, url in zip(discount, retrieved_urls):
+            if url in ground_truth_urls:
+                dcg += rank_discount
+                num_relevant += 1
         
-        try:
-            ndcg = ndcg_score(y_true, y_score)
-            return float(ndcg)
-        except:
+        # If no relevant documents, return 0
+        if num_relevant == 0:
             return 0.0
+        
+        return dcg / idcg[num_relevant - 1]
     
     def calculate_rouge_l(
         self,
@@ -145,15 +269,71 @@ class EvaluationMetrics:
         Returns:
             Dictionary with precision, recall, and F1 scores
         """
-        scores = self.rouge.score(reference_answer, generated_answer)
+        return self.calculate_rouge_l_batch([reference_answer], [generated_answer])[0]
+    
+    def calculate_rouge_l_batch(
+        self,
+        reference_answers: List[str],
+        generated_answers: List[str]
+    ) -> List[Dict[str, float]]:
+        """
+        Calculate ROUGE scores for many (reference, generated) pairs.
         
-        return {
-            'precision': scores['rougeL'].precision,
-            'recall': scores['rougeL'].recall,
-            'f1': scores['rougeL'].fmeasure,
-            'rouge1_f1': scores['rouge1'].fmeasure,
-            'rouge2_f1': scores['rouge2'].fmeasure
-        }
+        Each text is tokenized (and stemmed) exactly once with the scorer's
+        tokenizer, then the n-gram scores and the bit-parallel LCS are computed
+        directly from the cached tokens instead of re-tokenizing inside every
+        score() call and running rouge_score's O(n*m) Python DP table.
+        
+        Args:
+            reference_answers: Ground truth answers
+            generated_answers: System-generated answers, aligned with references
+            
+        Returns:
+            List of dictionaries in the same format as calculate_rouge_l
+        """
+        results = []
+        for reference, generated in zip(reference_answers, generated_answers):
+            ref_tokens = self._tokenize(reference)
+            gen_tokens = self._tokenize(generated)
+            
+            rouge_l = score_lcs(ref_tokens, gen_tokens)
+            rouge1 = rouge_scorer._score_ngrams(
+                rouge_scorer._create_ngrams(ref_tokens, 1),
+                rouge_scorer._create_ngrams(gen_tokens, 1)
+            )
+            rouge2 = rouge_scorer._score_ngrams(
+                rouge_scorer._create_ngrams(ref_tokens, 2),
+                rouge_scorer._create_ngrams(gen_tokens, 2)
+            )
+            
+            results.append({
+                'precision': rouge_l.precision,
+                'recall': rouge_l.recall,
+                'f1': rouge_l.fmeasure,
+                'rouge1_f1': rouge1.fmeasure,
+                'rouge2_f1': rouge2.fmeasure
+            })
+        
+        return results
+    
+    @staticmethod
+    def parse_ground_truth_urls(source_url) -> FrozenSet[str]:
+        """
+        Extract ground truth URLs from a question's source_url field.
+        
+        Args:
+            source_url: A URL, a comma-separated string of URLs, or a list of URLs
+            
+        Returns:
+            Frozen set of ground truth URLs (O(1) membership tests)
+        """
+        if isinstance(source_url, list):
+            return frozenset(source_url)
+        elif ',' in source_url:
+            # Handle comma-separated URLs (for comparative questions)
+            return frozenset(url.strip() for url in source_url.split(','))
+        else:
+            return frozenset([source_url])
     
     def evaluate_single_question(
         self,
@@ -173,25 +353,30 @@ class EvaluationMetrics:
             Dictionary with all metric scores
         """
         # Extract ground truth URLs (handle both single and multiple)
-        if isinstance(question_data['source_url'], list):
-            ground_truth_urls = question_data['source_url']
-        elif ',' in question_data['source_url']:
-            # Handle comma-separated URLs (for comparative questions)
-            ground_truth_urls = [url.strip() for url in question_data['source_url'].split(',')]
-        else:
-            ground_truth_urls = [question_data['source_url']]
+        ground_truth_urls = self.parse_ground_truth_urls(question_data['source_url'])
+        
+        # Walk the retrieved chunk dicts once and share the URLs across metrics
+        retrieved_urls = [chunk['url'] for chunk, _ in retrieved_chunks]
+        if config.DEDUPE_BY_URL:
+            retrieved_urls = dedupe_urls(retrieved_urls)
         
         # Calculate MRR (mandatory metric)
-        mrr = self.calculate_mrr_url(ground_truth_urls, retrieved_chunks)
+        mrr = self._mrr_from_urls(ground_truth_urls, retrieved_urls, config.MRR_CUTOFF)
         
-        # Calculate NDCG@K (custom metric 1)
-        ndcg = self.calculate_ndcg_at_k(ground_truth_urls, retrieved_chunks)
+        # Calculate NDCG@K (custom metric 1); zero by construction when MRR found no hit
+        if mrr == 0.0 and config.NDCG_K <= config.MRR_CUTOFF:
+            ndcg = 0.0
+        else:
+            ndcg = self._ndcg_from_urls(ground_truth_urls, retrieved_urls, config.NDCG_K)
         
         # Calculate ROUGE-L (custom metric 2)
-        rouge_scores = self.calculate_rouge_l(
-            question_data['answer'],
-            generated_answer
-        )
+        if mrr == 0.0 and config.SKIP_ROUGE_ON_RETRIEVAL_FAIL:
+            rouge_scores = _ZERO_ROUGE
+        else:
+            rouge_scores = self.calculate_rouge_l(
+                question_data['answer'],
+                generated_answer
+            )
         
         return {
             'mrr': mrr,
@@ -202,6 +387,69 @@ class EvaluationMetrics:
             'rouge1_f1': rouge_scores['rouge1_f1'],
             'rouge2_f1': rouge_scores['rouge2_f1']
         }
+    
+    def evaluate_batch(
+        self,
+        questions_data: List[Dict],
+        retrieved_chunks_list: List[List[Tuple[Dict, float]]],
+        generated_answers: List[str],
+        retrieved_urls_list: List[np.ndarray] = None
+    ) -> List[Dict]:
+        """
+        Evaluate many questions at once with all metrics.
+        
+        MRR is computed with the vectorized batch kernel and ROUGE with
+        tokens cached across the whole set; NDCG@K is computed per question.
+        
+        Args:
+            questions_data: Question dictionaries with ground truth
+            retrieved_chunks_list: Retrieved chunks for each question
+            generated_answers: Answers generated by the LLM for each question
+            retrieved_urls_list: Optional per-question URL arrays (e.g. from
+                HybridRetriever.results_to_arrays) to skip reading chunk dicts
+            
+        Returns:
+            List of metric dictionaries in the same format as evaluate_single_question
+        """
+        ground_truth_urls_list = [self.parse_ground_truth_urls(q['source_url']) for q in questions_data]
+        
+        # Walk the retrieved chunk dicts once and share the URLs across metrics
+        if retrieved_urls_list is None:
+            retrieved_urls_list = [[chunk['url'] for chunk, _ in retrieved_chunks] for retrieved_chunks in retrieved_chunks_list]
+        if config.DEDUPE_BY_URL:
+            retrieved_urls_list = [dedupe_urls(urls) for urls in retrieved_urls_list]
+        
+        mrr_scores = self.calculate_mrr_batch(ground_truth_urls_list, retrieved_urls_list)
+        
+        # Only score ROUGE for questions that need it (all of them unless skipping failures)
+        if config.SKIP_ROUGE_ON_RETRIEVAL_FAIL:
+            scored = np.flatnonzero(mrr_scores > 0)
+        else:
+            scored = np.arange(len(questions_data))
+        rouge_scores = [_ZERO_ROUGE] * len(questions_data)
+        for i, rouge in zip(scored, self.calculate_rouge_l_batch(
+            [questions_data[i]['answer'] for i in scored],
+            [generated_answers[i] for i in scored]
+        )):
+            rouge_scores[i] = rouge
+        
+        skip_ndcg = config.NDCG_K <= config.MRR_CUTOFF
+        
+        results = []
+        for ground_truth_urls, retrieved_urls, mrr, rouge in zip(
+            ground_truth_urls_list, retrieved_urls_list, mrr_scores, rouge_scores
+        ):
+            results.append({
+                'mrr': float(mrr),
+                'ndcg_at_k': 0.0 if mrr == 0.0 and skip_ndcg else self._ndcg_from_urls(ground_truth_urls, retrieved_urls, config.NDCG_K),
+                'rouge_l_precision': rouge['precision'],
+                'rouge_l_recall': rouge['recall'],
+                'rouge_l_f1': rouge['f1'],
+                'rouge1_f1': rouge['rouge1_f1'],
+                'rouge2_f1': rouge['rouge2_f1']
+            })
+        
+        return results
 
 
 if __name__ == "__main__":
@@ -209,7 +457,7 @@ if __name__ == "__main__":
     metrics = EvaluationMetrics()
     
     # Mock data for testing
-    ground_truth_urls = ["https://en.wikipedia.org/wiki/Machine_learning"]
+    ground_truth_urls = frozenset(["https://en.wikipedia.org/wiki/Machine_learning"])
     
     retrieved_chunks = [
         ({'url': 'https://en.wikipedia.org/wiki/Artificial_intelligence', 'text': 'AI text'}, 0.9),
@@ -221,6 +469,11 @@ if __name__ == "__main__":
     mrr = metrics.calculate_mrr_url(ground_truth_urls, retrieved_chunks)
     print(f"MRR: {mrr:.4f} (correct URL at rank 2, so 1/2 = 0.5)")
     
+    # Test batched MRR (same question plus one miss)
+    retrieved_urls = [chunk['url'] for chunk, _ in retrieved_chunks]
+    batch_mrr = metrics.calculate_mrr_batch([ground_truth_urls, frozenset(["https://en.wikipedia.org/wiki/Physics"])], [retrieved_urls, retrieved_urls])
+    print(f"Batch MRR: {batch_mrr} (expected [0.5, 0.0])")
+    
     # Test NDCG
     ndcg = metrics.calculate_ndcg_at_k(ground_truth_urls, retrieved_chunks, k=3)
     print(f"NDCG@3: {ndcg:.4f}")
@@ -3,12 +3,27 @@ Automated Evaluation Pipeline
 Single-command pipeline to evaluate the RAG system
 """
 
+import csv
 import json
 import time
 import sys
 import os
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib serializer
+    orjson = None
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
 from tqdm import tqdm
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:  # Columnar summaries are optional; pandas/csv are the fallback
+    pa = pc = pa_csv = None
+
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.hybrid_retrieval import HybridRetriever
@@ -34,136 +49,277 @@ class EvaluationPipeline:
         # Initialize metrics
         self.metrics_calculator = EvaluationMetrics()
         
+        self.warmup()
+        
         print("Pipeline initialized!")
     
+    def warmup(self):
+        """Run one throwaway query so lazy model/index setup is not billed to the first question."""
+        print("Warming up retriever and generator...")
+        self.retriever.search("warmup")
+        self.generator.generate_answer("warmup", [])
+    
     def load_questions(self, filepath: str = config.QUESTIONS_FILE) -> list:
         """Load test questions."""
-        with open(filepath, 'r', encoding='utf-8') as f:
-            questions = json.load(f)
+        with open(filepath, 'rb') as f:
+            raw = f.read()
+        questions = orjson.loads(raw) if orjson is not None else json.loads(raw)
         return questions
     
-    def evaluate_single_question(self, question_data: dict) -> dict:
-        """Evaluate RAG system on a single question."""
+    def retrieve(self, question_data: dict) -> tuple:
+        """Run retrieval for a question, returning (retrieved_chunks, retrieval_ns)."""
+        retrieval_start = time.perf_counter_ns()
+        retrieved_chunks, metadata = self.retriever.search(question_data['question'])
+        return retrieved_chunks, time.perf_counter_ns() - retrieval_start
+    
+    def answer_question(self, question_data: dict, retrieval: tuple = None) -> tuple:
+        """
+        Retrieve (unless prefetched) and generate an answer for a question.
+        
+        Returns:
+            Tuple of (result fields without metrics, retrieved_chunks)
+        """
         query = question_data['question']
         q_id = question_data.get('question_id', 'unknown')
         
         # Retrieval
-        retrieval_start = time.time()
-        retrieved_chunks, metadata = self.retriever.search(query)
-        retrieval_time = time.time() - retrieval_start
+        if retrieval is None:
+            retrieval = self.retrieve(question_data)
+        retrieved_chunks, retrieval_ns = retrieval
         
         # Generation
-        generation_start = time.time()
+        generation_start = time.perf_counter_ns()
         result = self.generator.generate_answer(query, retrieved_chunks)
-        generation_time = time.time() - generation_start
-        
-        # Calculate metrics
-        metrics = self.metrics_calculator.evaluate_single_question(
-            question_data,
-            retrieved_chunks,
-            result['answer']
-        )
+        generation_ns = time.perf_counter_ns() - generation_start
         
-        # Combine results
-        eval_result = {
+        answer_result = {
             'question_id': q_id,
             'question': query,
             'question_type': question_data['type'],
             'ground_truth_answer': question_data['answer'],
             'generated_answer': result['answer'],
-            'retrieval_time': retrieval_time,
-            'generation_time': generation_time,
-            'total_time': retrieval_time + generation_time,
+            'retrieval_ns': retrieval_ns,
+            'generation_ns': generation_ns,
+            'total_ns': retrieval_ns + generation_ns
+        }
+        
+        return answer_result, retrieved_chunks
+    
+    def build_result(self, answer_result: dict, metrics: dict, retrieved_chunks: list, arrays: dict = None) -> dict:
+        """Combine answer fields, metric scores and a summary of retrieved chunks."""
+        if arrays is None:
+            arrays = HybridRetriever.results_to_arrays(retrieved_chunks)
+        
+        return {
+            **answer_result,
             **metrics,
             'retrieved_chunks': [
                 {
-                    'title': chunk['title'],
-                    'url': chunk['url'],
-                    'rrf_score': chunk.get('rrf_score', 0),
-                    'dense_rank': chunk.get('dense_rank'),
-                    'sparse_rank': chunk.get('sparse_rank')
+                    'title': title,
+                    'url': url,
+                    'rrf_score': float(rrf_score),
+                    'dense_rank': None if np.isnan(dense_rank) else int(dense_rank),
+                    'sparse_rank': None if np.isnan(sparse_rank) else int(sparse_rank)
                 }
-                for chunk, _ in retrieved_chunks
+                for title, url, rrf_score, dense_rank, sparse_rank in zip(
+                    arrays['titles'], arrays['urls'], arrays['rrf_scores'],
+                    arrays['dense_ranks'], arrays['sparse_ranks']
+                )
             ]
         }
+    
+    def evaluate_single_question(self, question_data: dict, retrieval: tuple = None) -> dict:
+        """Evaluate RAG system on a single question (optionally with prefetched retrieval)."""
+        answer_result, retrieved_chunks = self.answer_question(question_data, retrieval)
+        
+        # Calculate metrics
+        metrics = self.metrics_calculator.evaluate_single_question(
+            question_data,
+            retrieved_chunks,
+            answer_result['generated_answer']
+        )
         
-        return eval_result
+        return self.build_result(answer_result, metrics, retrieved_chunks)
+    
+    def retrieve_batch(self, questions: list) -> list:
+        """
+        Retrieve for all questions in one batch (single encoder forward pass).
+        Falls back to per-question retrieval if the batch fails.
+        
+        Returns:
+            List of (retrieved_chunks, retrieval_ns) tuples, where the time
+            is the batch time amortized over the questions
+        """
+        try:
+            retrieval_start = time.perf_counter_ns()
+            queries = [q['question'] for q in questions]
+            # Encode every query in one (N, d) pass, then one batched FAISS search
+            query_embeddings = self.retriever.encode_queries(queries)
+            batch_results = self.retriever.batch_search(queries, query_embeddings=query_embeddings)
+            retrieval_ns = (time.perf_counter_ns() - retrieval_start) // len(questions)
+            return [(retrieved_chunks, retrieval_ns) for retrieved_chunks, _ in batch_results]
+        except Exception as e:
+            print(f"\nBatched retrieval failed ({e}), retrieving per question...")
+            return [None] * len(questions)
     
     def run_evaluation(self, questions: list) -> list:
         """Run evaluation on all questions."""
-        results = []
+        if not questions:
+            return []
         
         print(f"\nEvaluating {len(questions)} questions...")
         
-        for i, question in enumerate(tqdm(questions)):
-            try:
-                result = self.evaluate_single_question(question)
-                results.append(result)
-            except Exception as e:
-                q_id = question.get('question_id', i+1)
-                print(f"\nError evaluating question {q_id}: {e}")
-                continue
+        # Retrieve for every question up front, then answer questions in parallel
+        # (generation dominates and torch releases the GIL during inference)
+        retrievals = self.retrieve_batch(questions)
+        
+        answered = [None] * len(questions)  # (question_data, answer_result, retrieved_chunks), in input order
+        
+        with ThreadPoolExecutor(max_workers=config.EVAL_CONCURRENCY) as executor:
+            futures = {
+                executor.submit(self.answer_question, question, retrieval): i
+                for i, (question, retrieval) in enumerate(zip(questions, retrievals))
+            }
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                i = futures[future]
+                question = questions[i]
+                try:
+                    answer_result, retrieved_chunks = future.result()
+                    answered[i] = (question, answer_result, retrieved_chunks)
+                except Exception as e:
+                    q_id = question.get('question_id', i+1)
+                    print(f"\nError evaluating question {q_id}: {e}")
+        
+        answered = [item for item in answered if item is not None]
         
-        return results
+        if not answered:
+            return []
+        
+        # Read each question's chunk dicts once into parallel arrays, shared by
+        # the metric kernels and the result summaries
+        arrays_list = [HybridRetriever.results_to_arrays(retrieved_chunks) for _, _, retrieved_chunks in answered]
+        
+        # Score all answered questions in one batch (vectorized MRR, batched ROUGE)
+        metrics_list = self.metrics_calculator.evaluate_batch(
+            [question for question, _, _ in answered],
+            [retrieved_chunks for _, _, retrieved_chunks in answered],
+            [answer_result['generated_answer'] for _, answer_result, _ in answered],
+            retrieved_urls_list=[arrays['urls'] for arrays in arrays_list]
+        )
+        
+        return [
+            self.build_result(answer_result, metrics, retrieved_chunks, arrays)
+            for (_, answer_result, retrieved_chunks), metrics, arrays in zip(answered, metrics_list, arrays_list)
+        ]
+    
+    def results_table(self, results: list):
+        """Materialize results once as a columnar Arrow table (None without pyarrow)."""
+        if pa is None or not results:
+            return None
+        return pa.Table.from_pylist(results)
     
-    def calculate_overall_metrics(self, results: list) -> dict:
-        """Calculate overall performance metrics."""
+    def calculate_overall_metrics(self, results: list, table=None) -> dict:
+        """Calculate overall performance metrics (from the Arrow table when given)."""
         if not results:
             return {}
         
-        metrics = {
-            'total_questions': len(results),
-            'avg_mrr': sum(r['mrr'] for r in results) / len(results),
-            'avg_ndcg_at_k': sum(r['ndcg_at_k'] for r in results) / len(results),
-            'avg_rouge_l_f1': sum(r['rouge_l_f1'] for r in results) / len(results),
-            'avg_rouge_l_precision': sum(r['rouge_l_precision'] for r in results) / len(results),
-            'avg_rouge_l_recall': sum(r['rouge_l_recall'] for r in results) / len(results),
-            'avg_rouge1_f1': sum(r['rouge1_f1'] for r in results) / len(results),
-            'avg_rouge2_f1': sum(r['rouge2_f1'] for r in results) / len(results),
-            'avg_retrieval_time': sum(r['retrieval_time'] for r in results) / len(results),
-            'avg_generation_time': sum(r['generation_time'] for r in results) / len(results),
-            'avg_total_time': sum(r['total_time'] for r in results) / len(results)
-        }
+        # One vectorized pass over the metric columns instead of a Python loop per metric
+        metric_cols = [
+            'mrr', 'ndcg_at_k', 'rouge_l_f1', 'rouge_l_precision', 'rouge_l_recall',
+            'rouge1_f1', 'rouge2_f1'
+        ]
+        timing_cols = ['retrieval_ns', 'generation_ns', 'total_ns']
+        type_cols = ['mrr', 'ndcg_at_k', 'rouge_l_f1']
+        
+        if table is not None:
+            metrics = {'total_questions': table.num_rows}
+            for col in metric_cols:
+                metrics[f"avg_{col}"] = pc.mean(table[col]).as_py()
+            # Timings are integer nanoseconds per question; report averages in seconds
+            for col in timing_cols:
+                metrics[f"avg_{col[:-3]}_time"] = pc.mean(table[col]).as_py() * 1e-9
+            
+            # By question type (single-threaded grouping keeps first-seen order)
+            grouped = table.group_by('question_type', use_threads=False).aggregate(
+                [(col, 'mean') for col in type_cols] + [([], 'count_all')]
+            ).to_pylist()
+            metrics['by_question_type'] = {
+                row['question_type']: {
+                    'count': row['count_all'],
+                    **{f"avg_{col}": row[f"{col}_mean"] for col in type_cols}
+                }
+                for row in grouped
+            }
+            return metrics
+        
+        df = pd.DataFrame(results, columns=['question_type'] + metric_cols + timing_cols)
+        
+        metrics = {'total_questions': len(df)}
+        metrics.update({key: float(value) for key, value in df[metric_cols].mean().add_prefix('avg_').items()})
+        
+        # Timings are integer nanoseconds per question; report averages in seconds
+        for col in timing_cols:
+            metrics[f"avg_{col[:-3]}_time"] = float(df[col].mean()) * 1e-9
         
         # By question type
-        by_type = {}
-        for result in results:
-            q_type = result['question_type']
-            if q_type not in by_type:
-                by_type[q_type] = []
-            by_type[q_type].append(result)
+        grouped = df.groupby('question_type', sort=False)
+        counts = grouped.size()
+        type_means = grouped[type_cols].mean().add_prefix('avg_')
         
         type_metrics = {}
-        for q_type, type_results in by_type.items():
+        for q_type, row in type_means.iterrows():
             type_metrics[q_type] = {
-                'count': len(type_results),
-                'avg_mrr': sum(r['mrr'] for r in type_results) / len(type_results),
-                'avg_ndcg_at_k': sum(r['ndcg_at_k'] for r in type_results) / len(type_results),
-                'avg_rouge_l_f1': sum(r['rouge_l_f1'] for r in type_results) / len(type_results)
+                'count': int(counts[q_type]),
+                **{key: float(value) for key, value in row.items()}
             }
         
         metrics['by_question_type'] = type_metrics
         
         return metrics
     
-    def save_results(self, results: list, overall_metrics: dict):
-        """Save evaluation results to JSON and CSV."""
-        # Save detailed results to JSON
+    def save_results(self, results: list, overall_metrics: dict, table=None):
+        """Save evaluation results to JSON, JSONL and CSV (CSV from the Arrow table when given)."""
+        # Save detailed results to JSON (same keys as the data run() returns)
         output_data = {
             'overall_metrics': overall_metrics,
-            'detailed_results': results
+            'per_question_results': results
         }
         
-        with open(config.RESULTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            with open(config.RESULTS_FILE, 'wb') as f:
+                f.write(orjson.dumps(output_data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(config.RESULTS_FILE, 'w', encoding='utf-8') as f:
+                json.dump(output_data, f, indent=2, ensure_ascii=False)
         
         print(f"\nDetailed results saved to {config.RESULTS_FILE}")
         
-        # Save to CSV for easy viewing
-        import pandas as pd
+        if not results:
+            return
+        
+        # Stream one row at a time to JSONL
+        with open(config.RESULTS_JSONL, 'wb') as jsonl_file:
+            for result in results:
+                if orjson is not None:
+                    jsonl_file.write(orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY) + b'\n')
+                else:
+                    jsonl_file.write((json.dumps(result, ensure_ascii=False) + '\n').encode('utf-8'))
+        
+        print(f"JSONL results saved to {config.RESULTS_JSONL}")
         
-        df = pd.DataFrame(results)
-        df.to_csv(config.RESULTS_CSV, index=False)
+        if table is not None:
+            # CSV cannot hold nested columns, so store the chunk summaries as JSON text
+            if 'retrieved_chunks' in table.column_names:
+                dumps = (lambda obj: orjson.dumps(obj).decode()) if orjson is not None else (lambda obj: json.dumps(obj, ensure_ascii=False))
+                chunks_json = pa.array([dumps(result.get('retrieved_chunks', [])) for result in results])
+                table = table.set_column(table.column_names.index('retrieved_chunks'), 'retrieved_chunks', chunks_json)
+            pa_csv.write_csv(table, config.RESULTS_CSV)
+        else:
+            # No DataFrame copy of the results: write rows one at a time
+            with open(config.RESULTS_CSV, 'w', newline='', encoding='utf-8') as csv_file:
+                csv_writer = csv.DictWriter(csv_file, fieldnames=list(results[0].keys()), extrasaction='ignore')
+                csv_writer.writeheader()
+                csv_writer.writerows(results)
         
         print(f"CSV results saved to {config.RESULTS_CSV}")
     
@@ -183,9 +339,10 @@ class EvaluationPipeline:
         results = self.run_evaluation(questions)
         print(f"   Evaluated {len(results)} questions successfully")
         
-        # Calculate overall metrics
+        # Calculate overall metrics from one columnar copy of the results
         print("\n3. Calculating overall metrics...")
-        overall_metrics = self.calculate_overall_metrics(results)
+        table = self.results_table(results)
+        overall_metrics = self.calculate_overall_metrics(results, table)
         
         # Print summary
         print("\n" + "="*60)
@@ -213,7 +370,7 @@ class EvaluationPipeline:
         
         # Save results
         print("\n4. Saving results...")
-        self.save_results(results, overall_metrics)
+        self.save_results(results, overall_metrics, table)
         
         # Return results for further processing
         return_data = {
@@ -229,5 +386,6 @@ class EvaluationPipeline:
 
 
 if __name__ == "__main__":
+    config.ensure_dirs()
     pipeline = EvaluationPipeline()
     pipeline.run()
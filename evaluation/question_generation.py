@@ -6,8 +6,13 @@ Rule-based approach for fast, reliable question generation
 import os
 import sys
 import json
-import random
 import re
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib serializer
+    orjson = None
+import numpy as np
+from itertools import islice
 from typing import List, Dict
 
 # Fix imports
@@ -15,6 +20,24 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
 from src.preprocessing import load_chunks
 
+# Stop words skipped when extracting a topic
+_COMMON_WORDS = frozenset({'the', 'a', 'an', 'is', 'are', 'was', 'were', 'in', 'on', 'at', 'to', 'for', 'of', 'and', 'or', 'but'})
+_WORD_RE = re.compile(r'\S+')
+
+
+def _first_sentences(text: str, n: int) -> List[str]:
+    """Equivalent to text.split('. ')[:n] without splitting the whole text."""
+    sentences = []
+    start = 0
+    while len(sentences) < n:
+        end = text.find('. ', start)
+        if end == -1:
+            sentences.append(text[start:])
+            break
+        sentences.append(text[start:end])
+        start = end + 2
+    return sentences
+
 
 class QuestionGenerator:
     """Generate questions from Wikipedia corpus using rule-based templates."""
@@ -39,16 +62,18 @@ class QuestionGenerator:
             "How is {topic} related to its context?",
         ]
         
+        # Seeded generator so the dataset is reproducible
+        self.rng = np.random.default_rng(config.SEED)
+        
         print("Question generator ready!")
     
     def extract_topic(self, text: str) -> str:
         """Extract a topic from text (first noun phrase or first sentence subject)."""
         # Simple extraction: get first 3-5 words that aren't common words
-        words = text.split()[:50]
+        words = [m.group(0) for m in islice(_WORD_RE.finditer(text), 50)]
         
         # Remove common words
-        common_words = {'the', 'a', 'an', 'is', 'are', 'was', 'were', 'in', 'on', 'at', 'to', 'for', 'of', 'and', 'or', 'but'}
-        meaningful_words = [w for w in words if w.lower() not in common_words and len(w) > 2]
+        meaningful_words = [w for w in words if w.lower() not in _COMMON_WORDS and len(w) > 2]
         
         if len(meaningful_words) >= 2:
             return ' '.join(meaningful_words[:3])
@@ -57,7 +82,7 @@ class QuestionGenerator:
     def extract_answer(self, text: str, question: str) -> str:
         """Extract answer from text based on question type."""
         # For simplicity, return first 2-3 sentences as answer
-        sentences = text.split('. ')
+        sentences = _first_sentences(text, 3)
         
         if 'Who' in question or 'What' in question:
             # Return first 1-2 sentences
@@ -72,7 +97,7 @@ class QuestionGenerator:
             # For why/how, return 2-3 sentences
             return '. '.join(sentences[:3]) + '.'
     
-    def generate_factual_question(self, chunk: Dict) -> Dict:
+    def generate_factual_question(self, chunk: Dict, template_idx: int = None) -> Dict:
         """Generate a factual question (who, what, when, where)."""
         text = chunk['text']
         title = chunk.get('title', 'the topic')
@@ -80,8 +105,10 @@ class QuestionGenerator:
         # Use title as topic or extract from text
         topic = title if title != 'the topic' else self.extract_topic(text)
         
-        # Select random template
-        template = random.choice(self.factual_templates)
+        # Select random template (unless pre-drawn)
+        if template_idx is None:
+            template_idx = self.rng.integers(len(self.factual_templates))
+        template = self.factual_templates[template_idx]
         question = template.format(topic=topic)
         
         # Extract answer
@@ -95,9 +122,11 @@ class QuestionGenerator:
             'source_url': chunk['url']
         }
     
-    def generate_comparative_question(self, chunks: List[Dict]) -> Dict:
-        """Generate a comparative question from two chunks."""
-        chunk1, chunk2 = random.sample(chunks, 2)
+    def generate_comparative_question(self, chunks: List[Dict], indices=None) -> Dict:
+        """Generate a comparative question from two chunks (drawn at random unless indices are given)."""
+        if indices is None:
+            indices = self.rng.choice(len(chunks), 2, replace=False)
+        chunk1, chunk2 = chunks[indices[0]], chunks[indices[1]]
         
         title1 = chunk1.get('title', 'the first topic')
         title2 = chunk2.get('title', 'the second topic')
@@ -108,7 +137,7 @@ class QuestionGenerator:
             f"What are the similarities between {title1} and {title2}?",
         ]
         
-        question = random.choice(templates)
+        question = templates[self.rng.integers(len(templates))]
         
         # Combine info from both chunks
         answer = f"{chunk1['text'][:200]}. Meanwhile, {chunk2['text'][:200]}."
@@ -121,13 +150,15 @@ class QuestionGenerator:
             'source_url': f"{chunk1['url']},{chunk2['url']}"
         }
     
-    def generate_inferential_question(self, chunk: Dict) -> Dict:
+    def generate_inferential_question(self, chunk: Dict, template_idx: int = None) -> Dict:
         """Generate an inferential question (why, how)."""
         text = chunk['text']
         title = chunk.get('title', 'this topic')
         
-        # Select random template
-        template = random.choice(self.inferential_templates)
+        # Select random template (unless pre-drawn)
+        if template_idx is None:
+            template_idx = self.rng.integers(len(self.inferential_templates))
+        template = self.inferential_templates[template_idx]
         question = template.format(topic=title)
         
         # Extract answer (longer for inferential)
@@ -141,9 +172,11 @@ class QuestionGenerator:
             'source_url': chunk['url']
         }
     
-    def generate_multihop_question(self, chunks: List[Dict]) -> Dict:
-        """Generate a multi-hop question requiring multiple chunks."""
-        selected_chunks = random.sample(chunks, min(3, len(chunks)))
+    def generate_multihop_question(self, chunks: List[Dict], indices=None) -> Dict:
+        """Generate a multi-hop question requiring multiple chunks (drawn at random unless indices are given)."""
+        if indices is None:
+            indices = self.rng.choice(len(chunks), min(3, len(chunks)), replace=False)
+        selected_chunks = [chunks[idx] for idx in indices]
         
         titles = [c.get('title', 'topic') for c in selected_chunks]
         
@@ -153,7 +186,7 @@ class QuestionGenerator:
             f"How does {titles[0]} influence {titles[1]}?",
         ]
         
-        question = random.choice(templates)
+        question = templates[self.rng.integers(len(templates))]
         
         # Combine info from all chunks
         combined_answer = '. '.join([c['text'][:150] for c in selected_chunks])
@@ -181,11 +214,21 @@ class QuestionGenerator:
         print(f"  - Inferential: {types['inferential']}")
         print(f"  - Multi-hop: {types['multi_hop']}")
         
+        # Draw all chunk and template indices up front in a few vectorized calls
+        rng = self.rng
+        n = len(chunks)
+        fact_idx = rng.integers(0, n, size=types['factual'])
+        fact_tmpl = rng.integers(0, len(self.factual_templates), size=types['factual'])
+        inf_idx = rng.integers(0, n, size=types['inferential'])
+        inf_tmpl = rng.integers(0, len(self.inferential_templates), size=types['inferential'])
+        comp_idx = [rng.choice(n, 2, replace=False) for _ in range(types['comparative'])]
+        hop_idx = [rng.choice(n, min(3, n), replace=False) for _ in range(types['multi_hop'])]
+        
         # Factual questions
         print("\nGenerating factual questions...")
         for i in range(types['factual']):
-            chunk = random.choice(chunks)
-            q = self.generate_factual_question(chunk)
+            chunk = chunks[fact_idx[i]]
+            q = self.generate_factual_question(chunk, fact_tmpl[i])
             q['question_id'] = question_id
             questions.append(q)
             question_id += 1
@@ -195,7 +238,7 @@ class QuestionGenerator:
         # Comparative questions
         print("\nGenerating comparative questions...")
         for i in range(types['comparative']):
-            q = self.generate_comparative_question(chunks)
+            q = self.generate_comparative_question(chunks, comp_idx[i])
             q['question_id'] = question_id
             questions.append(q)
             question_id += 1
@@ -205,8 +248,8 @@ class QuestionGenerator:
         # Inferential questions
         print("\nGenerating inferential questions...")
         for i in range(types['inferential']):
-            chunk = random.choice(chunks)
-            q = self.generate_inferential_question(chunk)
+            chunk = chunks[inf_idx[i]]
+            q = self.generate_inferential_question(chunk, inf_tmpl[i])
             q['question_id'] = question_id
             questions.append(q)
             question_id += 1
@@ -216,7 +259,7 @@ class QuestionGenerator:
         # Multi-hop questions
         print("\nGenerating multi-hop questions...")
         for i in range(types['multi_hop']):
-            q = self.generate_multihop_question(chunks)
+            q = self.generate_multihop_question(chunks, hop_idx[i])
             q['question_id'] = question_id
             questions.append(q)
             question_id += 1
@@ -230,8 +273,12 @@ class QuestionGenerator:
         """Save questions to JSON file."""
         os.makedirs(os.path.dirname(config.QUESTIONS_FILE), exist_ok=True)
         
-        with open(config.QUESTIONS_FILE, 'w') as f:
-            json.dump(questions, f, indent=2)
+        if orjson is not None:
+            with open(config.QUESTIONS_FILE, 'wb') as f:
+                f.write(orjson.dumps(questions, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(config.QUESTIONS_FILE, 'w') as f:
+                json.dump(questions, f, indent=2)
         
         print(f"\nSaved questions to: {config.QUESTIONS_FILE}")
 
@@ -4,11 +4,20 @@ Generates HTML and PDF reports
 """
 
 import json
+import hashlib
 import os
 from datetime import datetime
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib parser
+    orjson = None
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # Non-interactive backend: reports are only saved to PNG
 import matplotlib.pyplot as plt
-import seaborn as sns
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -19,6 +28,213 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
 
+# Optimized zlib encoding for report PNGs: smaller files at a modest encode cost
+PNG_SAVE_OPTIONS = {'optimize': True, 'compress_level': 6}
+
+# Static report chrome, built once at import; only the metric sections are formatted per call
+_HTML_HEAD = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            <title>Hybrid RAG System - Evaluation Report</title>
+            <style>
+                body {
+                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+                    margin: 40px;
+                    background-color: #f5f6fa;
+                }
+                h1 {
+                    color: #2c3e50;
+                    border-bottom: 3px solid #3498db;
+                    padding-bottom: 10px;
+                }
+                h2 {
+                    color: #34495e;
+                    margin-top: 30px;
+                   border-left: 4px solid #3498db;
+                    padding-left: 15px;
+                }
+                .metric-box {
+                    background: white;
+                    padding: 20px;
+                    margin: 20px 0;
+                    border-radius: 10px;
+                    box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+                }
+                .metric {
+                    display: inline-block;
+                    padding: 15px 25px;
+                    margin: 10px;
+                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+                    color: white;
+                    border-radius: 8px;
+                    font-weight: bold;
+                }
+                .metric-label {
+                    font-size: 0.9em;
+                    opacity: 0.9;
+                }
+                .metric-value {
+                    font-size: 1.8em;
+                    display: block;
+                    margin-top: 5px;
+                }
+                table {
+                    width: 100%;
+                    border-collapse: collapse;
+                    margin: 20px 0;
+                    background: white;
+                    border-radius: 10px;
+                    overflow: hidden;
+                    box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+                }
+                th {
+                    background: #3498db;
+                    color: white;
+                    padding: 15px;
+                    text-align: left;
+                }
+                td {
+                    padding: 12px 15px;
+                    border-bottom: 1px solid #ecf0f1;
+                }
+                tr:hover {
+                    background: #f8f9fa;
+                }
+                .justification {
+                    background: #e8f4f8;
+                    padding: 15px;
+                    margin: 15px 0;
+                    border-left: 4px solid #3498db;
+                    border-radius: 5px;
+                }
+                img {
+                    max-width: 800px;
+                    display: block;
+                    height: auto;
+                    margin: 20px auto;
+                    border-radius: 10px;
+                    box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+                }
+                .chart-grid {
+                    display: grid;
+                    grid-template-columns: repeat(2, 1fr);
+                    gap: 20px;
+                    max-width: 1000px;
+                    margin: 20px auto;
+                }
+                .chart-grid img {
+                    max-width: 100%;
+                    margin: 0;
+                }
+            </style>
+        </head>
+        <body>
+"""
+
+_HTML_TAIL = """
+            <h2>Visualizations</h2>
+            <div class="chart-grid">
+                <img src="metrics_overall.png" alt="Overall Evaluation Metrics">
+                <img src="metrics_response_time.png" alt="Average Response Time Breakdown">
+                <img src="metrics_mrr_distribution.png" alt="MRR Score Distribution">
+                <img src="metrics_mrr_by_type.png" alt="MRR by Question Type">
+            </div>
+            
+            <h2>Conclusion</h2>
+            <div class="metric-box">
+                <p>The Hybrid RAG system successfully integrates dense and sparse retrieval mechanisms to deliver a robust question-answering experience over a Wikipedia corpus. By combining FAISS-based semantic search with BM25 keyword matching via Reciprocal Rank Fusion (RRF), the system achieves higher retrieval accuracy than either method individually.</p>
+                
+                <p><strong>Key Performance Indicators:</strong></p>
+                <ul>
+                    <li><strong>Retrieval Quality:</strong> The system maintains a high Mean Reciprocal Rank (MRR), indicating that correct source documents are consistently ranked near the top.</li>
+                    <li><strong>Answer Quality:</strong> ROUGE-L scores indicate that the generation model needs improvement. The low overlap (F1 = 0.028) suggests that while retrieval is working well, the Flan-T5-base model struggles to synthesize answers that align closely with ground truth phrasing.</li>
+                    <li><strong>Latency:</strong> Average response times are within acceptable limits for real-time interaction.</li>
+                </ul>
+
+                <p><strong>Future Improvements:</strong></p>
+                <ul>
+                    <li>Upgrading to larger LLM models (e.g., Flan-T5-large, Llama 2, Mistral) to improve generation quality and semantic alignment.</li>
+                    <li>Refining prompts to encourage better use of retrieved context.</li>
+                    <li>Incorporating query expansion to better handle ambiguous user inputs.</li>
+                    <li>Implementing a re-ranking stage after RRF to further refine the top context chunks before generation.</li>
+                </ul>
+                
+                <p><strong>System Overview:</strong></p>
+                <p>This Hybrid RAG system was built on a corpus of 500 Wikipedia articles, processed into chunks of 200-400 tokens with 50-token overlap. The system evaluated 100 questions across 4 categories (30 factual, 20 comparative, 30 inferential, 20 multi-hop) and demonstrated exceptional retrieval performance with an overall MRR of 0.968 and NDCG@3 of 0.962.</p>
+                
+                <p>The hybrid architecture successfully combines dense and sparse retrieval for improved accuracy. Ablation studies confirm that the hybrid RRF approach (95% accuracy) matches dense-only retrieval (95%) while significantly outperforming sparse-only BM25 (90%), validating the architectural choice. Multi-hop questions achieved perfect MRR (1.000), while comparative questions, despite being more challenging, still maintained strong performance (MRR: 0.925).</p>
+                
+                <p>Performance metrics show efficient operation with average retrieval time of just 0.06 seconds and total end-to-end response time of 1.53 seconds per question. The system successfully demonstrates the efficacy of combining semantic (FAISS) and lexical (BM25) search through Reciprocal Rank Fusion, achieving near-perfect document retrieval across diverse question types.</p>
+            </div>
+        </body>
+        </html>
+"""
+
+
+def _render_chart(plot, args, path: str) -> str:
+    """
+    Draw one chart on its own figure and save it as PNG.
+    
+    Args:
+        plot: Function drawing onto a matplotlib Axes, called as plot(ax, *args)
+        args: Data passed to plot
+        path: Output PNG path
+    
+    Returns:
+        The output path
+    """
+    fig = Figure(figsize=(6, 5))
+    FigureCanvasAgg(fig)
+    plot(fig.subplots(), *args)
+    fig.tight_layout()
+    fig.savefig(path, dpi=config.REPORT_DPI, bbox_inches='tight', pil_kwargs=PNG_SAVE_OPTIONS)
+    return path
+
+
+def _plot_overall_metrics(ax, metrics_names, metrics_values):
+    """MRR, NDCG and ROUGE-L averages."""
+    ax.bar(metrics_names, metrics_values, color=['#3498db', '#e74c3c', '#2ecc71'])
+    ax.set_ylabel('Score')
+    ax.set_title('Overall Evaluation Metrics', fontweight='bold')
+    ax.set_ylim(0, 1.0)
+    for i, v in enumerate(metrics_values):
+        ax.text(i, v + 0.02, f'{v:.3f}', ha='center', fontweight='bold')
+
+
+def _plot_response_times(ax, time_values):
+    """Average retrieval, generation and total time."""
+    ax.bar(['Retrieval', 'Generation', 'Total'], time_values, color=['#9b59b6', '#e67e22', '#1abc9c'])
+    ax.set_ylabel('Time (seconds)')
+    ax.set_title('Average Response Time Breakdown', fontweight='bold')
+    for i, v in enumerate(time_values):
+        ax.text(i, v + 0.02, f'{v:.2f}s', ha='center', fontweight='bold')
+
+
+def _plot_mrr_distribution(ax, mrr_scores, avg_mrr):
+    """Histogram of per-question MRR (binned with NumPy over a fixed [0, 1] range)."""
+    counts, edges = np.histogram(mrr_scores, bins=20, range=(0.0, 1.0))
+    ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge', color='#3498db', edgecolor='black', alpha=0.7)
+    ax.set_xlabel('MRR Score')
+    ax.set_ylabel('Frequency')
+    ax.set_title('MRR Score Distribution', fontweight='bold')
+    ax.axvline(x=avg_mrr, color='red', linestyle='--', linewidth=2, label=f'Mean: {avg_mrr:.3f}')
+    ax.legend()
+
+
+def _plot_mrr_by_type(ax, types, mrr_by_type):
+    """Average MRR per question type."""
+    x = range(len(types))
+    ax.bar(x, mrr_by_type, color='#2ecc71')
+    ax.set_xticks(x)
+    ax.set_xticklabels(types, rotation=45)
+    ax.set_ylabel('Average MRR')
+    ax.set_title('MRR by Question Type', fontweight='bold')
+    ax.set_ylim(0, 1.0)
+    for i, v in enumerate(mrr_by_type):
+        ax.text(i, v + 0.02, f'{v:.3f}', ha='center', fontweight='bold')
+
 
 class ReportGenerator:
     """Generate comprehensive evaluation reports in HTML and PDF formats."""
@@ -26,79 +242,53 @@ class ReportGenerator:
     def __init__(self):
         """Initialize report generator."""
         self.styles = getSampleStyleSheet()
-        sns.set_palette("husl")
+        
+        # Figure is created once and cleared between charts instead of reallocated
+        self._chart_fig, self._chart_ax = plt.subplots(figsize=(8, 5))
     
     def create_metric_visualizations(self, results: dict, output_dir: str):
         """Create all metric visualizations."""
         visualizations = {}
         
-        # 1. Overall metrics bar chart
-        metrics_data = results['overall_metrics']
-        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(12, 10))
+        # Columnar view of the per-question results, built once and shared by all charts
+        if results.get('per_question_results'):
+            df = pd.DataFrame(results['per_question_results']).reindex(columns=['question_type', 'mrr'])
+            df['mrr'] = df['mrr'].fillna(0.0)
+        else:
+            df = None
         
-        # MRR, NDCG, ROUGE-L
+        # 1. Overview charts
+        metrics_data = results['overall_metrics']
         metrics_names = ['MRR', f'NDCG@{config.NDCG_K}', 'ROUGE-L F1']
         metrics_values = [
             metrics_data['avg_mrr'],
             metrics_data['avg_ndcg_at_k'],
             metrics_data['avg_rouge_l_f1']
         ]
-        ax1.bar(metrics_names, metrics_values, color=['#3498db', '#e74c3c', '#2ecc71'])
-        ax1.set_ylabel('Score')
-        ax1.set_title('Overall Evaluation Metrics', fontweight='bold')
-        ax1.set_ylim(0, 1.0)
-        for i, v in enumerate(metrics_values):
-            ax1.text(i, v + 0.02, f'{v:.3f}', ha='center', fontweight='bold')
-        
-        # Performance metrics
-        time_metrics = ['Retrieval', 'Generation', 'Total']
         time_values = [
             metrics_data['avg_retrieval_time'],
             metrics_data['avg_generation_time'],
             metrics_data['avg_total_time']
         ]
-        ax2.bar(time_metrics, time_values, color=['#9b59b6', '#e67e22', '#1abc9c'])
-        ax2.set_ylabel('Time (seconds)')
-        ax2.set_title('Average Response Time Breakdown', fontweight='bold')
-        for i, v in enumerate(time_values):
-            ax2.text(i, v + 0.02, f'{v:.2f}s', ha='center', fontweight='bold')
-        
-        # MRR distribution
-        detailed_key = 'detailed_results' if 'detailed_results' in results else 'per_question_results'
-        mrr_scores = []
-        if detailed_key in results:
-            mrr_scores = [r.get('mrr', 0) for r in results[detailed_key]]
+        if df is not None:
+            mrr_scores = df['mrr'].to_numpy(dtype=np.float64)
         else:
-            mrr_scores = [metrics_data['avg_mrr']] * 10
-        
-        ax3.hist(mrr_scores, bins=20, color='#3498db', edgecolor='black', alpha=0.7)
-        ax3.set_xlabel('MRR Score')
-        ax3.set_ylabel('Frequency')
-        ax3.set_title('MRR Score Distribution', fontweight='bold')
-        ax3.axvline(x=metrics_data['avg_mrr'], color='red', linestyle='--', linewidth=2, label=f'Mean: {metrics_data["avg_mrr"]:.3f}')
-        ax3.legend()
-        
-        # Metrics by question type
+            mrr_scores = np.full(10, metrics_data['avg_mrr'])
         by_type = metrics_data['by_question_type']
         types = list(by_type.keys())
-        mrr_by_type = [by_type[t]['avg_mrr'] for t in types]
-        
-        x = range(len(types))
-        ax4.bar(x, mrr_by_type, color='#2ecc71')
-        ax4.set_xticks(x)
-        ax4.set_xticklabels(types, rotation=45)
-        ax4.set_ylabel('Average MRR')
-        ax4.set_title('MRR by Question Type', fontweight='bold')
-        ax4.set_ylim(0, 1.0)
-        for i, v in enumerate(mrr_by_type):
-            ax4.text(i, v + 0.02, f'{v:.3f}', ha='center', fontweight='bold')
-        
-        plt.tight_layout()
-        metrics_viz_path = os.path.join(output_dir, 'metrics_overview.png')
-        plt.savefig(metrics_viz_path, dpi=300, bbox_inches='tight')
-        plt.close()
+        if df is not None:
+            mrr_by_type = df.groupby('question_type', sort=False)['mrr'].mean().reindex(types, fill_value=0.0).tolist()
+        else:
+            mrr_by_type = [by_type[t]['avg_mrr'] for t in types]
         
-        visualizations['metrics_overview'] = metrics_viz_path
+        # The four overview charts, drawn after the ablation and error charts
+        overview_jobs = {
+            'metrics_overall': (_plot_overall_metrics, (metrics_names, metrics_values)),
+            'metrics_response_time': (_plot_response_times, (time_values,)),
+            'metrics_mrr_distribution': (_plot_mrr_distribution, (mrr_scores, metrics_data['avg_mrr'])),
+            'metrics_mrr_by_type': (_plot_mrr_by_type, (types, mrr_by_type)),
+        }
+        overview_paths = {name: os.path.join(output_dir, f'{name}.png') for name in overview_jobs}
         
         # 2. Ablation Study Chart
         if 'ablation_study' in results:
@@ -112,20 +302,20 @@ class ReportGenerator:
             
             accuracies = [dense_acc, sparse_acc, hybrid_acc]
             
-            plt.figure(figsize=(8, 5))
-            bars = plt.bar(methods, accuracies, color=['#3498db', '#9b59b6', '#2ecc71'])
-            plt.ylabel('Accuracy')
-            plt.title('Ablation Study: Retrieval Method Comparison', fontweight='bold')
-            plt.ylim(0, 1.1)
+            ax = self._chart_ax
+            ax.clear()
+            bars = ax.bar(methods, accuracies, color=['#3498db', '#9b59b6', '#2ecc71'])
+            ax.set_ylabel('Accuracy')
+            ax.set_title('Ablation Study: Retrieval Method Comparison', fontweight='bold')
+            ax.set_ylim(0, 1.1)
             
             for bar in bars:
                 height = bar.get_height()
-                plt.text(bar.get_x() + bar.get_width()/2., height + 0.01,
+                ax.text(bar.get_x() + bar.get_width()/2., height + 0.01,
                         f'{height:.1%}', ha='center', va='bottom', fontweight='bold')
                         
             ablation_viz_path = os.path.join(output_dir, 'ablation_study.png')
-            plt.savefig(ablation_viz_path, dpi=300, bbox_inches='tight')
-            plt.close()
+            self._chart_fig.savefig(ablation_viz_path, dpi=config.REPORT_DPI, bbox_inches='tight', pil_kwargs=PNG_SAVE_OPTIONS)
             visualizations['ablation_study'] = ablation_viz_path
 
         # 3. Error Analysis Chart (Stacked)
@@ -142,116 +332,40 @@ class ReportGenerator:
                 gen_fails.append(stats.get('generation_failure_rate', 0))
                 
             x = range(len(q_types))
-            plt.figure(figsize=(8, 5))
+            ax = self._chart_ax
+            ax.clear()
             
-            p1 = plt.bar(x, retrieval_fails, color='#e74c3c', label='Retrieval Failures')
-            p2 = plt.bar(x, gen_fails, bottom=retrieval_fails, color='#f39c12', label='Generation Failures')
+            p1 = ax.bar(x, retrieval_fails, color='#e74c3c', label='Retrieval Failures')
+            p2 = ax.bar(x, gen_fails, bottom=retrieval_fails, color='#f39c12', label='Generation Failures')
             
-            plt.ylabel('Failure Rate')
-            plt.title('Error Analysis by Question Type (Retrieval vs Generation)', fontweight='bold')
-            plt.xticks(x, [q.replace('_', ' ').title() for q in q_types])
-            plt.legend()
-            plt.ylim(0, 1.1)
+            ax.set_ylabel('Failure Rate')
+            ax.set_title('Error Analysis by Question Type (Retrieval vs Generation)', fontweight='bold')
+            ax.set_xticks(x)
+            ax.set_xticklabels([q.replace('_', ' ').title() for q in q_types])
+            ax.legend()
+            ax.set_ylim(0, 1.1)
             
             err_viz_path = os.path.join(output_dir, 'error_analysis.png')
-            plt.savefig(err_viz_path, dpi=300, bbox_inches='tight')
-            plt.close()
+            self._chart_fig.savefig(err_viz_path, dpi=config.REPORT_DPI, bbox_inches='tight', pil_kwargs=PNG_SAVE_OPTIONS)
             visualizations['error_analysis'] = err_viz_path
         
+        # Overview charts, each on its own small figure
+        for name, (plot, args) in overview_jobs.items():
+            visualizations[name] = _render_chart(plot, args, overview_paths[name])
+        
         return visualizations
     
     def generate_html_report(self, results: dict, output_path: str):
-        """Generate HTML evaluation report."""
+        """Generate HTML evaluation report, streaming it straight to disk."""
+        with open(output_path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            self._write_html_report(results, f.write)
+    
+    def _write_html_report(self, results: dict, w):
+        """Write the HTML report piece by piece through the writer callable w."""
         metrics = results['overall_metrics']
         
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>Hybrid RAG System - Evaluation Report</title>
-            <style>
-                body {{
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                    margin: 40px;
-                    background-color: #f5f6fa;
-                }}
-                h1 {{
-                    color: #2c3e50;
-                    border-bottom: 3px solid #3498db;
-                    padding-bottom: 10px;
-                }}
-                h2 {{
-                    color: #34495e;
-                    margin-top: 30px;
-                   border-left: 4px solid #3498db;
-                    padding-left: 15px;
-                }}
-                .metric-box {{
-                    background: white;
-                    padding: 20px;
-                    margin: 20px 0;
-                    border-radius: 10px;
-                    box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-                }}
-                .metric {{
-                    display: inline-block;
-                    padding: 15px 25px;
-                    margin: 10px;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white;
-                    border-radius: 8px;
-                    font-weight: bold;
-                }}
-                .metric-label {{
-                    font-size: 0.9em;
-                    opacity: 0.9;
-                }}
-                .metric-value {{
-                    font-size: 1.8em;
-                    display: block;
-                    margin-top: 5px;
-                }}
-                table {{
-                    width: 100%;
-                    border-collapse: collapse;
-                    margin: 20px 0;
-                    background: white;
-                    border-radius: 10px;
-                    overflow: hidden;
-                    box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-                }}
-                th {{
-                    background: #3498db;
-                    color: white;
-                    padding: 15px;
-                    text-align: left;
-                }}
-                td {{
-                    padding: 12px 15px;
-                    border-bottom: 1px solid #ecf0f1;
-                }}
-                tr:hover {{
-                    background: #f8f9fa;
-                }}
-                .justification {{
-                    background: #e8f4f8;
-                    padding: 15px;
-                    margin: 15px 0;
-                    border-left: 4px solid #3498db;
-                    border-radius: 5px;
-                }}
-                img {{
-                    max-width: 800px;
-                    display: block;
-                    height: auto;
-                    margin: 20px auto;
-                    border-radius: 10px;
-                    box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-                }}
-            </style>
-        </head>
-        <body>
+        w(_HTML_HEAD)
+        w(f"""
             <h1> Hybrid RAG System - Evaluation Report</h1>
             <p><strong>Generated:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
             <p><strong>Total Questions Evaluated:</strong> {metrics['total_questions']}</p>
@@ -332,32 +446,20 @@ class ReportGenerator:
             </div>
             
             <h2> Performance by Question Type</h2>
-            <table>
-                <tr>
-                    <th>Question Type</th>
-                    <th>Count</th>
-                    <th>Avg MRR</th>
-                    <th>Avg NDCG@K</th>
-                    <th>Avg ROUGE-L F1</th>
-                </tr>
-        """
+        """)
         
-        for q_type, type_metrics in metrics['by_question_type'].items():
-            html += f"""
-                <tr>
-                    <td>{q_type.capitalize()}</td>
-                    <td>{type_metrics['count']}</td>
-                    <td>{type_metrics['avg_mrr']:.4f}</td>
-                    <td>{type_metrics['avg_ndcg_at_k']:.4f}</td>
-                    <td>{type_metrics['avg_rouge_l_f1']:.4f}</td>
-                </tr>
-            """
+        # Build the whole table in one pass instead of formatting row by row
+        type_df = pd.DataFrame.from_dict(metrics['by_question_type'], orient='index').reindex(
+            columns=['count', 'avg_mrr', 'avg_ndcg_at_k', 'avg_rouge_l_f1']
+        )
+        type_df.index = type_df.index.str.capitalize()
+        type_df.columns = ['Count', 'Avg MRR', 'Avg NDCG@K', 'Avg ROUGE-L F1']
+        type_df = type_df.rename_axis('Question Type').reset_index()
+        w(type_df.to_html(float_format=lambda x: f'{x:.4f}', classes='qtype', border=0, index=False))
         
-        html += """
-            </table>
-            
+        w("""
             <h2>Ablation Study Results</h2>
-        """
+        """)
         
         if 'ablation_study' in results:
             ablation = results['ablation_study']
@@ -372,7 +474,7 @@ class ReportGenerator:
             else:
                  ablation_comment = "The sparse retrieval method outperformed the hybrid approach in this evaluation."
 
-            html += f"""
+            w(f"""
             <div class="metric-box">
                 <p><strong>Dense-only Accuracy:</strong> {dense_mrr:.4f}</p>
                 <p><strong>Sparse-only (BM25) Accuracy:</strong> {sparse_mrr:.4f}</p>
@@ -380,11 +482,11 @@ class ReportGenerator:
                 <p><em>{ablation_comment}</em></p>
             </div>
             <img src="ablation_study.png" alt="Ablation Study">
-            """
+            """)
         
-        html += """
+        w("""
             <h2>Error Analysis</h2>
-        """
+        """)
         
         if 'error_analysis' in results:
             error_data = results['error_analysis']
@@ -393,72 +495,69 @@ class ReportGenerator:
             else:
                 analysis_items = error_data
                 
-            html += '<img src="error_analysis.png" alt="Error Analysis">'
-            html += '<table><tr><th>Question Type</th><th>Retrieval Failures</th><th>Generation Failures</th><th>Total Questions</th></tr>'
+            w('<img src="error_analysis.png" alt="Error Analysis">')
             
-            for q_type, analysis in analysis_items.items():
-                if isinstance(analysis, dict):
-                    # New format with split tracking
-                    retrieval_fail = analysis.get('retrieval_failed', 0)
-                    generation_fail = analysis.get('generation_failed', 0)
-                    total = analysis.get('total', 0)
-                    
-                    if total > 0:
-                        r_rate = retrieval_fail / total
-                        g_rate = generation_fail / total
-                        html += f'<tr><td>{q_type.replace("_", " ").title()}</td><td>{r_rate:.1%} ({retrieval_fail}/{total})</td><td>{g_rate:.1%} ({generation_fail}/{total})</td><td>{total}</td></tr>'
-                    else:
-                        html += f'<tr><td>{q_type.replace("_", " ").title()}</td><td>0.0% (0/0)</td><td>0.0% (0/0)</td><td>0</td></tr>'
-                else:
-                    # Fallback for old format
-                    html += f'<tr><td>{q_type.replace("_", " ").title()}</td><td>Unknown</td><td>Unknown</td><td>Unknown</td></tr>'
+            # Format all rows at once; entries without per-type counts show as Unknown
+            split_items = {q_type: analysis for q_type, analysis in analysis_items.items() if isinstance(analysis, dict)}
+            err_df = pd.DataFrame.from_dict(split_items, orient='index').reindex(
+                index=list(analysis_items), columns=['total', 'retrieval_failed', 'generation_failed']
+            )
+            known = pd.Series(err_df.index.isin(list(split_items)), index=err_df.index)
+            err_df = err_df.fillna(0).astype(int)
+            totals = err_df['total'].where(err_df['total'] > 0)
             
-            html += '</table>'
-        
-        html += """
-            <h2>Visualizations</h2>
-            <img src="metrics_overview.png" alt="Metrics Overview">
+            def rate_column(failed):
+                rates = (err_df[failed] / totals).fillna(0.0)
+                column = (rates.map('{:.1%}'.format) + ' (' + err_df[failed].astype(str) + '/' + err_df['total'].astype(str) + ')')
+                return column.where(known, 'Unknown')
             
-            <h2>Conclusion</h2>
-            <div class="metric-box">
-                <p>The Hybrid RAG system successfully integrates dense and sparse retrieval mechanisms to deliver a robust question-answering experience over a Wikipedia corpus. By combining FAISS-based semantic search with BM25 keyword matching via Reciprocal Rank Fusion (RRF), the system achieves higher retrieval accuracy than either method individually.</p>
-                
-                <p><strong>Key Performance Indicators:</strong></p>
-                <ul>
-                    <li><strong>Retrieval Quality:</strong> The system maintains a high Mean Reciprocal Rank (MRR), indicating that correct source documents are consistently ranked near the top.</li>
-                    <li><strong>Answer Quality:</strong> ROUGE-L scores indicate that the generation model needs improvement. The low overlap (F1 = 0.028) suggests that while retrieval is working well, the Flan-T5-base model struggles to synthesize answers that align closely with ground truth phrasing.</li>
-                    <li><strong>Latency:</strong> Average response times are within acceptable limits for real-time interaction.</li>
-                </ul>
-
-                <p><strong>Future Improvements:</strong></p>
-                <ul>
-                    <li>Upgrading to larger LLM models (e.g., Flan-T5-large, Llama 2, Mistral) to improve generation quality and semantic alignment.</li>
-                    <li>Refining prompts to encourage better use of retrieved context.</li>
-                    <li>Incorporating query expansion to better handle ambiguous user inputs.</li>
-                    <li>Implementing a re-ranking stage after RRF to further refine the top context chunks before generation.</li>
-                </ul>
-                
-                <p><strong>System Overview:</strong></p>
-                <p>This Hybrid RAG system was built on a corpus of 500 Wikipedia articles, processed into chunks of 200-400 tokens with 50-token overlap. The system evaluated 100 questions across 4 categories (30 factual, 20 comparative, 30 inferential, 20 multi-hop) and demonstrated exceptional retrieval performance with an overall MRR of 0.968 and NDCG@3 of 0.962.</p>
-                
-                <p>The hybrid architecture successfully combines dense and sparse retrieval for improved accuracy. Ablation studies confirm that the hybrid RRF approach (95% accuracy) matches dense-only retrieval (95%) while significantly outperforming sparse-only BM25 (90%), validating the architectural choice. Multi-hop questions achieved perfect MRR (1.000), while comparative questions, despite being more challenging, still maintained strong performance (MRR: 0.925).</p>
-                
-                <p>Performance metrics show efficient operation with average retrieval time of just 0.06 seconds and total end-to-end response time of 1.53 seconds per question. The system successfully demonstrates the efficacy of combining semantic (FAISS) and lexical (BM25) search through Reciprocal Rank Fusion, achieving near-perfect document retrieval across diverse question types.</p>
-            </div>
-        </body>
-        </html>
-        """
+            err_table = pd.DataFrame({
+                'Retrieval Failures': rate_column('retrieval_failed'),
+                'Generation Failures': rate_column('generation_failed'),
+                'Total Questions': err_df['total'].astype(str).where(known, 'Unknown')
+            })
+            err_table.index = err_table.index.str.replace('_', ' ').str.title()
+            err_table = err_table.rename_axis('Question Type').reset_index()
+            w(err_table.to_html(classes='errors', border=0, index=False))
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(html)
+        w(_HTML_TAIL)
     
     def generate_reports(self, results_path: str):
         """Generate all reports from results file."""
-        import shutil
         # Load results
-        with open(results_path, 'r', encoding='utf-8') as f:
-            results = json.load(f)
-            
+        with open(results_path, 'rb') as f:
+            raw = f.read()
+        results = orjson.loads(raw) if orjson is not None else json.loads(raw)
+        
+        self.generate_reports_from_dict(results)
+    
+    def _report_cache_key(self, results: dict) -> str:
+        """Hash of the results plus this module's source, so styling edits also invalidate the cache."""
+        if orjson is not None:
+            payload = orjson.dumps(results, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        else:
+            payload = json.dumps(results, sort_keys=True, default=str).encode('utf-8')
+        key = hashlib.blake2b(payload, digest_size=16)
+        with open(os.path.abspath(__file__), 'rb') as f:
+            key.update(f.read())
+        key.update(str(config.REPORT_DPI).encode())
+        return key.hexdigest()
+    
+    def generate_reports_from_dict(self, results: dict):
+        """Generate all reports from an in-memory results dictionary (no re-parse from disk)."""
+        import shutil
+        
+        # Skip the matplotlib and HTML passes when nothing changed since the last run
+        html_path = os.path.join(config.REPORTS_DIR, 'evaluation_report.html')
+        key_path = os.path.join(config.REPORTS_DIR, '.report_cache_key')
+        expected_outputs = [html_path, os.path.join(config.REPORTS_DIR, 'metrics_overall.png')]
+        cache_key = self._report_cache_key(results)
+        if os.path.exists(key_path) and all(os.path.exists(path) for path in expected_outputs):
+            with open(key_path, 'r', encoding='utf-8') as f:
+                if f.read().strip() == cache_key:
+                    print(f"Reports are up to date (results unchanged): {html_path}")
+                    return
+        
         # Copy architecture diagram
         source_diagram = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docs', 'system_dataflow.png')
         target_diagram = os.path.join(config.REPORTS_DIR, 'architecture_diagram.png')
@@ -477,14 +576,17 @@ class ReportGenerator:
         
         # Generate HTML report
         print("Generating HTML report...")
-        html_path = os.path.join(config.REPORTS_DIR, 'evaluation_report.html')
         self.generate_html_report(results, html_path)
         
+        with open(key_path, 'w', encoding='utf-8') as f:
+            f.write(cache_key)
+        
         print(f"\nReports generated successfully!")
         print(f"   HTML: {html_path}")
 
 
 if __name__ == "__main__":
+    config.ensure_dirs()
     generator = ReportGenerator()
     
     # Check if extended results exist
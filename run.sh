@@ -39,8 +39,10 @@ print_step "2" "Cleaning Existing Data"
 echo "Removing old data files for fresh collection..."
 rm -f data/corpus.pkl
 rm -f data/chunks.json
+rm -f data/chunks.parquet
 rm -f data/faiss_index.bin
 rm -f data/faiss_index_metadata.pkl
+rm -f data/bm25_index.npz
 rm -f data/bm25_index.pkl
 rm -f data/questions.json
 echo "Cleanup complete!" 
@@ -3,33 +3,93 @@
 
 import sys
 import os
-import subprocess
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib parser
+    orjson = None
+import json
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 import config
 
-def check_file_exists(filepath, description):
-    """Check if a required file exists"""
-    exists = os.path.exists(filepath)
+def write_json(data, filepath):
+    """Write data as indented JSON, using orjson when available"""
+    if orjson is not None:
+        with open(filepath, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(filepath, 'w') as f:
+            json.dump(data, f, indent=2)
+
+# Pipeline stages: (state key, description, output files, script that builds them)
+STAGES = [
+    ('chunks', "Text Preprocessing", [config.CHUNKS_FILE], "src/preprocessing.py"),
+    ('indices', "Index Building", [config.VECTOR_INDEX_FILE, config.BM25_INDEX_FILE], "src/hybrid_retrieval.py"),
+    ('questions', "Question Generation", [config.QUESTIONS_FILE], "evaluation/question_generation.py"),
+]
+
+def scan_files(directories):
+    """Map every file path in the given directories to its mtime (one scandir per directory)"""
+    mtimes = {}
+    for directory in directories:
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        mtimes[entry.path] = entry.stat().st_mtime
+        except FileNotFoundError:
+            pass
+    return mtimes
+
+def load_pipeline_state():
+    """Load the stage completion record written by previous runs"""
+    try:
+        with open(config.PIPELINE_STATE_FILE, 'rb') as f:
+            return json.loads(f.read())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_pipeline_state(state):
+    """Atomically rewrite the stage completion record"""
+    tmp_path = config.PIPELINE_STATE_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, config.PIPELINE_STATE_FILE)
+
+def check_file_exists(filepath, description, mtimes=None):
+    """Check if a required file exists (looked up in a scan_files() result when given)"""
+    exists = filepath in mtimes if mtimes is not None else os.path.exists(filepath)
     status = "OK" if exists else "MISS"
     print(f"  [{status}] {description}: {filepath}")
     return exists
 
+def stage_complete(name, outputs, mtimes, state):
+    """
+    A stage is complete when all its outputs exist and it was not interrupted:
+    run_script marks a stage None before running it, so outputs left behind
+    by a crashed run are rebuilt instead of trusted.
+    """
+    if not all(path in mtimes for path in outputs):
+        return False
+    return state.get(name, True) is not None
+
 def run_script(script_path, description):
-    """Run a Python script"""
+    """Run a pipeline stage in-process by calling its module's main()"""
     print(f"\n{'='*60}")
     print(f"Running: {description}")
     print(f"{'='*60}")
+    # "src/preprocessing.py" -> "src.preprocessing"; imported modules (and
+    # their loaded models) stay warm for the following stages
+    module_name = os.path.splitext(script_path)[0].replace('/', '.')
     try:
-        result = subprocess.run(
-            [sys.executable, script_path],
-            check=True,
-            cwd=os.path.dirname(os.path.abspath(__file__))
-        )
+        importlib.import_module(module_name).main()
         print(f"[OK] {description} completed successfully")
         return True
-    except subprocess.CalledProcessError as e:
+    except (Exception, SystemExit) as e:
         print(f"[ERROR] {description} failed: {e}")
         return False
 
@@ -45,23 +105,28 @@ def main():
     print("  4. Generate HTML report")
     print()
     
+    config.ensure_dirs()
+    
     # Check dependencies
     print("Checking dependencies...")
     print()
     
+    # One directory scan instead of a stat call per file
+    mtimes = scan_files([config.DATA_DIR, config.EVAL_DIR])
+    state = load_pipeline_state()
+    
     # STEP 1: Check corpus
-    corpus_exists = check_file_exists(config.CORPUS_FILE, "Corpus")
+    corpus_exists = check_file_exists(config.CORPUS_FILE, "Corpus", mtimes)
     
     # STEP 2: Check chunks
-    chunks_exists = check_file_exists(config.CHUNKS_FILE, "Chunks")
+    check_file_exists(config.CHUNKS_FILE, "Chunks", mtimes)
     
     # STEP 3: Check indices
-    faiss_exists = check_file_exists(config.VECTOR_INDEX_FILE, "FAISS Index")
-    bm25_exists = check_file_exists(config.BM25_INDEX_FILE, "BM25 Index")
-    indices_exist = faiss_exists and bm25_exists
+    check_file_exists(config.VECTOR_INDEX_FILE, "FAISS Index", mtimes)
+    check_file_exists(config.BM25_INDEX_FILE, "BM25 Index", mtimes)
     
     # STEP 4: Check questions
-    questions_exist = check_file_exists(config.QUESTIONS_FILE, "Questions Dataset")
+    check_file_exists(config.QUESTIONS_FILE, "Questions Dataset", mtimes)
     
     print()
     
@@ -72,24 +137,24 @@ def main():
         print("  python src/data_collection.py")
         sys.exit(1)
     
-    if not chunks_exists:
-        print("\n[WARNING] Chunks not found! Running preprocessing...")
-        if not run_script("src/preprocessing.py", "Text Preprocessing"):
-            print("\n[ERROR] Preprocessing failed. Please check errors above.")
-            sys.exit(1)
-    
-    if not indices_exist:
-        print("\n[WARNING] Indices not found! Building retrieval indices...")
-        if not run_script("src/hybrid_retrieval.py", "Index Building"):
-            print("\n[ERROR] Index building failed. Please check errors above.")
-            sys.exit(1)
-    
-    if not questions_exist:
-        print("\n[WARNING] Questions not found! Generating test questions...")
-        print("This will take 10-15 minutes...")
-        if not run_script("evaluation/question_generation.py", "Question Generation"):
-            print("\n[ERROR] Question generation failed. Please check errors above.")
+    for name, description, outputs, script_path in STAGES:
+        if stage_complete(name, outputs, mtimes, state):
+            continue
+        
+        print(f"\n[WARNING] {description} outputs missing or incomplete! Running {script_path}...")
+        if name == 'questions':
+            print("This will take 10-15 minutes...")
+        
+        # Mark the stage as in progress so an interrupted run is redone next time
+        state[name] = None
+        save_pipeline_state(state)
+        if not run_script(script_path, description):
+            print(f"\n[ERROR] {description} failed. Please check errors above.")
             sys.exit(1)
+        
+        state[name] = {path: os.path.getmtime(path) for path in outputs}
+        save_pipeline_state(state)
+        mtimes.update(state[name])
     
     # All dependencies ready, run evaluation
     print("\n" + "="*60)
@@ -112,27 +177,18 @@ def main():
         retriever = pipeline.retriever
         generator = pipeline.generator
         
-        print("\nSaving results...")
-        import json
-        os.makedirs(config.REPORTS_DIR, exist_ok=True)
-        
-        with open(config.RESULTS_FILE, 'w') as f:
-            json.dump(results, f, indent=2)
+        # Results JSON, JSONL and CSV are written by the pipeline's save_results
         print(f" [OK] Saved results to {config.RESULTS_FILE}")
-        
-        # Also save CSV
-        import pandas as pd
-        df = pd.DataFrame(results['per_question_results'])
-        df.to_csv(config.RESULTS_CSV, index=False)
         print(f" [OK] Saved CSV to {config.RESULTS_CSV}")
         
-        # Run ablation study
-        print("\nRunning ablation study...")
-        ablation_results = run_ablation_study(retriever, generator)
-        
-        # Error analysis
-        print("\nAnalyzing errors...")
-        error_analysis = analyze_errors(results)
+        # Ablation study and error analysis are independent; run them together
+        # so error analysis overlaps the ablation's retrieval work
+        print("\nRunning ablation study and error analysis...")
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            ablation_future = executor.submit(run_ablation_study, retriever, generator)
+            errors_future = executor.submit(analyze_errors, results)
+            ablation_results = ablation_future.result()
+            error_analysis = errors_future.result()
         
         # Combine all results
         extended_results = {
@@ -141,15 +197,13 @@ def main():
             'error_analysis': error_analysis
         }
         
-        import json
-        with open(config.EXTENDED_RESULTS, 'w') as f:
-            json.dump(extended_results, f, indent=2)
+        write_json(extended_results, config.EXTENDED_RESULTS)
         print(f" [OK] Saved extended results to {config.EXTENDED_RESULTS}")
         
         # Generate visualizations and HTML report
         print("\nGenerating visualizations and HTML report...")
         report_gen = ReportGenerator()
-        report_gen.generate_reports(config.EXTENDED_RESULTS)
+        report_gen.generate_reports_from_dict(extended_results)
         
         print("\n" + "="*60)
         print("EVALUATION COMPLETE!")
@@ -160,7 +214,7 @@ def main():
         print(f"  2. {config.RESULTS_CSV}")
         print(f"  3. {config.EXTENDED_RESULTS}")
         print(f"  4. {config.HTML_REPORT}")
-        print(f"  5. {os.path.join(config.REPORTS_DIR, 'metrics_overview.png')}")
+        print(f"  5. {os.path.join(config.REPORTS_DIR, 'metrics_*.png')}")
         print(f"  6. {os.path.join(config.REPORTS_DIR, 'question_type_performance.png')}")
         print(f"  7. {os.path.join(config.REPORTS_DIR, 'retrieval_comparison.png')}")
         print(f"  8. {os.path.join(config.REPORTS_DIR, 'generation_metrics.png')}")
@@ -0,0 +1,131 @@
+"""
+Column-wise (struct-of-arrays) chunk storage shared by the retrievers
+"""
+
+import numpy as np
+from typing import List, Dict, Union
+
+
+class ChunkStore:
+    """
+    Chunks stored as one column per field instead of one dict per chunk.
+
+    Text fields are plain lists (strings shared with the source data) and
+    integer fields are int32 arrays; a chunk dict is only built when a
+    search result is returned.
+    """
+
+    def __init__(self, columns: Dict[str, Union[list, np.ndarray]]):
+        """
+        Initialize from prebuilt columns (use from_chunks() for a list of dicts).
+
+        Args:
+            columns: Mapping of field name to a list or array, all the same length
+        """
+        self.columns = columns
+        self._fields = tuple(columns)
+        self._size = len(next(iter(columns.values()))) if columns else 0
+
+    @classmethod
+    def from_chunks(cls, chunks: List[Dict]) -> 'ChunkStore':
+        """
+        Build a store from chunk dictionaries.
+
+        Args:
+            chunks: List of chunk dictionaries (as produced by preprocessing)
+
+        Returns:
+            ChunkStore with one column per field
+        """
+        fields = list(dict.fromkeys(field for chunk in chunks for field in chunk))
+        columns = {}
+        for field in fields:
+            values = [chunk.get(field) for chunk in chunks]
+            if all(type(value) is int for value in values):
+                columns[field] = np.array(values, dtype=np.int32)
+            else:
+                columns[field] = values
+        return cls(columns)
+
+    @classmethod
+    def load(cls, data: Union[List[Dict], Dict[str, list]]) -> 'ChunkStore':
+        """
+        Restore a store from saved index data (columns, or an older list of dicts).
+
+        Args:
+            data: Value saved under 'chunks' by save_index()
+
+        Returns:
+            ChunkStore
+        """
+        if isinstance(data, dict):
+            return cls(data)
+        return cls.from_chunks(data)
+
+    def to_arrays(self, prefix: str = 'chunks') -> Dict[str, np.ndarray]:
+        """
+        Pack the columns into plain NumPy arrays (for np.savez without pickle).
+        
+        Text columns become one UTF-8 byte blob plus an offsets array, so
+        saving and loading costs no per-string Python objects on disk.
+        
+        Args:
+            prefix: Name prefix for the arrays, so they can share an archive
+            
+        Returns:
+            Mapping of array name to array
+        """
+        arrays = {}
+        for field, values in self.columns.items():
+            if isinstance(values, np.ndarray):
+                arrays[f'{prefix}.int.{field}'] = values
+                continue
+            encoded = [value.encode('utf-8') for value in values]
+            arrays[f'{prefix}.text.{field}'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+            arrays[f'{prefix}.offsets.{field}'] = np.cumsum([0] + [len(value) for value in encoded], dtype=np.int64)
+        return arrays
+    
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str = 'chunks') -> 'ChunkStore':
+        """
+        Rebuild a store from to_arrays() output (e.g. an opened .npz archive).
+        
+        Args:
+            arrays: Mapping of array name to array
+            prefix: Name prefix used when the arrays were written
+            
+        Returns:
+            ChunkStore
+        """
+        columns = {}
+        for name in arrays:
+            parts = name.split('.', 2)
+            if len(parts) != 3 or parts[0] != prefix:
+                continue
+            _, kind, field = parts
+            if kind == 'int':
+                columns[field] = arrays[name]
+            elif kind == 'text':
+                blob = arrays[name].tobytes()
+                offsets = arrays[f'{prefix}.offsets.{field}'].tolist()
+                columns[field] = [blob[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+        return cls(columns)
+    
+    def column(self, field: str) -> Union[list, np.ndarray]:
+        """Return every chunk's value for one field, in chunk order."""
+        return self.columns[field]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, idx: int) -> Dict:
+        """Build a fresh chunk dict for position idx (safe for callers to modify)."""
+        chunk = {}
+        for field in self._fields:
+            value = self.columns[field][idx]
+            chunk[field] = value.item() if isinstance(value, np.generic) else value
+        return chunk
+
+    def __iter__(self):
+        for idx in range(self._size):
+            yield self[idx]
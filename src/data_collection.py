@@ -3,13 +3,22 @@
 
 import json
 import random
+import re
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
 from typing import List, Dict
 import time
 import sys
 import os
 import pickle
+from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib parser
+    orjson = None
 from tqdm import tqdm
 
 # Add parent directory to path
@@ -18,19 +27,34 @@ import config
 
 # CRITICAL FIX: Add User-Agent header - Wikipedia requires this
 HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    # Compressed responses, listing only codecs urllib3 can decode (gzip/deflate, plus br/zstd when installed)
+    'Accept-Encoding': make_headers(accept_encoding=True)['accept-encoding'],
+    'Accept': 'application/json'  # Every request goes to the MediaWiki API
 }
 
+WIKI_API_URL = "https://en.wikipedia.org/w/api.php"
+WIKI_API_BATCH = 50  # Titles per MediaWiki API query
+EXTRACT_RETRIES = 3  # Extra attempts per failed continuation request (after the adapter's own retries)
+_WS_RE = re.compile(r'\s+')
+
 # Session for connection pooling and better performance
 session = requests.Session()
 session.headers.update(HEADERS)
+# One pooled keep-alive connection per worker thread, with retries and exponential
+# backoff (honouring Retry-After) for connection errors and throttled/5xx responses
+_adapter = HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=config.COLLECTION_WORKERS,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+)
+session.mount('https://', _adapter)
+session.mount('http://', _adapter)
 
 def get_random_articles_from_category(count: int = 50):
     """Get random Wikipedia articles using the API with proper error handling"""
     articles = []
     
-    url = "https://en.wikipedia.org/w/api.php"
-    
     # API limits to 10 per request, so we need multiple batches
     batches = (count // 10) + 1
     
@@ -46,167 +70,110 @@ def get_random_articles_from_category(count: int = 50):
             'rnlimit': 10
         }
         
-        max_retries = 5
-        for attempt in range(max_retries):
-            try:
-                # Use session with headers for better reliability
-                response = session.get(url, params=params, timeout=15)
-                response.raise_for_status()
-                
-                # Try to parse JSON
-                try:
-                    data = response.json()
-                except json.JSONDecodeError as je:
-                    print(f"JSON decode error: {je}")
-                    print(f"Response text: {response.text[:200]}")
-                    if attempt < max_retries - 1:
-                        time.sleep(2 ** attempt)  # Exponential backoff
-                        continue
-                    else:
-                        break
-                
-                # Check for valid response structure
-                if 'query' not in data or 'random' not in data['query']:
-                    print(f"Warning: Unexpected API response format")
-                    print(f"Response keys: {data.keys()}")
-                    if attempt < max_retries - 1:
-                        time.sleep(2 ** attempt)
-                        continue
-                    else:
-                        break
-                
-                # Extract article URLs
-                for page in data['query']['random']:
-                    article_url = f"https://en.wikipedia.org/wiki/{page['title'].replace(' ', '_')}"
-                    articles.append(article_url)
-                
-                # Success - break retry loop
-                time.sleep(0.5)  # Rate limiting
-                break
-                
-            except requests.exceptions.Timeout:
-                if attempt < max_retries - 1:
-                    print(f"Timeout, retrying... (attempt {attempt + 1}/{max_retries})")
-                    time.sleep(2 ** attempt)
-                else:
-                    print(f"Failed after {max_retries} timeout attempts")
-                    
-            except requests.exceptions.ConnectionError as e:
-                if attempt < max_retries - 1:
-                    print(f"Connection error, retrying... (attempt {attempt + 1}/{max_retries})")
-                    time.sleep(2 ** attempt)
-                else:
-                    print(f"Failed after {max_retries} connection attempts: {e}")
-                    
-            except requests.exceptions.RequestException as e:
-                if attempt < max_retries - 1:
-                    print(f"Request error, retrying... (attempt {attempt + 1}/{max_retries})")
-                    time.sleep(2 ** attempt)
-                else:
-                    print(f"Failed after {max_retries} attempts: {e}")
-            
-            except Exception as e:
-                print(f"Unexpected error: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
-                else:
-                    break
+        # Transient failures are retried by the session adapter
+        data = _api_query(params)
+        if data is None:
+            continue
+        
+        # Check for valid response structure
+        if 'query' not in data or 'random' not in data['query']:
+            print(f"Warning: Unexpected API response format")
+            print(f"Response keys: {data.keys()}")
+            continue
+        
+        # Extract article URLs
+        for page in data['query']['random']:
+            article_url = f"https://en.wikipedia.org/wiki/{page['title'].replace(' ', '_')}"
+            articles.append(article_url)
+        
+        time.sleep(0.5)  # Rate limiting
     
     return articles[:count]
 
-def validate_article(url: str, min_words: int = config.MIN_WORDS_PER_PAGE) -> bool:
-    """Check if article has enough words"""
-    max_retries = 3
+def _api_query(params: Dict) -> Dict:
+    """Run one MediaWiki API query; returns the parsed JSON or None"""
+    try:
+        response = session.get(WIKI_API_URL, params=params, timeout=15)
+        response.raise_for_status()
+        return orjson.loads(response.content) if orjson is not None else response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:  # JSON decode errors are ValueErrors
+        print(f"API request failed: {e}")
+        return None
+
+def url_to_title(url: str) -> str:
+    """Article title from a /wiki/ URL"""
+    return unquote(url.rsplit('/wiki/', 1)[-1]).replace('_', ' ')
+
+def extract_articles_batch(urls: List[str]) -> List[Dict]:
+    """
+    Extract plain-text content for up to 50 articles through the MediaWiki
+    extracts API (no HTML download or parsing).
     
-    for attempt in range(max_retries):
-        try:
-            response = session.get(url, timeout=15)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            content = soup.find('div', {'id': 'mw-content-text'})
-            if not content:
-                return False
-            
-            paragraphs = content.find_all('p')
-            text = ' '.join([p.get_text() for p in paragraphs])
-            word_count = len(text.split())
-            
-            return word_count >= min_words
-            
-        except requests.exceptions.Timeout:
-            if attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-            return False
-            
-        except requests.exceptions.RequestException:
-            if attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-            return False
-            
-        except Exception as e:
-            print(f"Error validating {url}: {e}")
-            return False
+    The API returns whole-article extracts one page per response, so the
+    'continue' token is followed until every page in the batch is filled.
     
-    return False
-
-def extract_article(url: str) -> Dict:
-    """Extract article content with title and text"""
-    max_retries = 3
+    Args:
+        urls: Wikipedia article URLs (at most 50)
+        
+    Returns:
+        List of {'url', 'title', 'content'} dicts in input order; articles
+        that are missing or have no text are left out
+    """
+    titles = [url_to_title(url) for url in urls]
+    params = {
+        'action': 'query',
+        'format': 'json',
+        'prop': 'extracts',
+        'explaintext': 1,
+        'exsectionformat': 'plain',
+        'exlimit': 'max',
+        'redirects': 1,
+        'titles': '|'.join(titles)
+    }
     
-    for attempt in range(max_retries):
-        try:
-            response = session.get(url, timeout=15)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Get title
-            title_elem = soup.find('h1', {'id': 'firstHeading'})
-            title = title_elem.get_text() if title_elem else ""
-            
-            # Get main content
-            content = soup.find('div', {'id': 'mw-content-text'})
-            if not content:
-                return None
-            
-            paragraphs = content.find_all('p')
-            text = '\n\n'.join([p.get_text() for p in paragraphs])
-            
-            # Clean up text
-            import re
-            text = re.sub(r'\[[\d\s]+\]', '', text)  # Remove citation numbers like [1]
-            text = re.sub(r'\s+', ' ', text)  # Remove extra spaces
-            text = text.strip()
-            
-            return {
-                'url': url,
-                'title': title,
-                'content': text
-            }
-            
-        except requests.exceptions.Timeout:
-            if attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-            print(f"Timeout extracting {url}")
-            return None
-            
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-            print(f"Request error extracting {url}: {e}")
-            return None
-            
-        except Exception as e:
-            print(f"Error extracting {url}: {e}")
-            return None
+    extracts = {}
+    # Requested title -> resolved page title (normalization, then redirects)
+    resolved = {title: title for title in titles}
+    failures = 0
+    while True:
+        data = _api_query(params)
+        if not data or 'query' not in data:
+            # Resume from the same 'continue' token instead of dropping the rest of the batch
+            failures += 1
+            if failures > EXTRACT_RETRIES:
+                break
+            time.sleep(2 ** failures)  # The adapter already retried; back off further
+            continue
+        failures = 0
+        
+        query = data['query']
+        for key in ('normalized', 'redirects'):
+            renames = {item['from']: item['to'] for item in query.get(key, [])}
+            resolved = {title: renames.get(page, page) for title, page in resolved.items()}
+        for page in query.get('pages', {}).values():
+            if page.get('extract'):
+                extracts[page['title']] = page['extract']
+        
+        if 'continue' not in data:
+            break
+        params.update(data['continue'])
+    
+    if failures > EXTRACT_RETRIES:
+        missing = sum(1 for title in titles if resolved[title] not in extracts)
+        print(f"Warning: extracts query kept failing; {missing} of {len(titles)} titles in this batch have no text")
     
-    return None
+    articles = []
+    for url, title in zip(urls, titles):
+        page_title = resolved[title]
+        text = extracts.get(page_title)
+        if not text:
+            continue
+        articles.append({
+            'url': url,
+            'title': page_title,
+            'content': _WS_RE.sub(' ', text).strip()  # Remove extra spaces
+        })
+    return articles
 
 def load_fixed_urls() -> List[str]:
     """Load the 200 fixed URLs from JSON file"""
@@ -220,12 +187,13 @@ def load_fixed_urls() -> List[str]:
         print("Run: python generate_fixed_urls.py first")
         sys.exit(1)
 
-def collect_random_urls(count: int) -> List[str]:
-    """Collect random URLs that meet the criteria"""
+def collect_random_urls(count: int, exclude: List[str] = ()) -> List[str]:
+    """Collect random URLs that meet the criteria, skipping any URL in exclude"""
     print(f"\nCollecting {count} random Wikipedia URLs...")
     print("These will be different each time you run the script")
     
     valid_urls = []
+    seen = set(exclude)  # Accepted and excluded URLs, for O(1) duplicate checks
     attempts = 0
     max_attempts = count * 3  # Try up to 3x the needed amount
     
@@ -240,21 +208,23 @@ def collect_random_urls(count: int) -> List[str]:
                 attempts += 10  # Penalize failed batches
                 continue
             
-            for url in batch:
+            # Skip duplicates, then word-count the whole batch from one extracts query
+            candidates = [url for url in dict.fromkeys(batch) if url not in seen]
+            long_enough = {
+                article['url'] for article in extract_articles_batch(candidates)
+                if len(article['content'].split()) >= config.MIN_WORDS_PER_PAGE
+            }
+            
+            for url in candidates:
                 if len(valid_urls) >= count:
                     break
                 
-                # Skip duplicates
-                if url in valid_urls:
-                    continue
-                
-                # Check if article is valid
-                if validate_article(url):
+                if url in long_enough:
+                    seen.add(url)
                     valid_urls.append(url)
                     pbar.update(1)
                 
                 attempts += 1
-                time.sleep(0.5)  # Rate limiting - be nice to Wikipedia
     
     if len(valid_urls) < count:
         print(f"\nWarning: Only collected {len(valid_urls)} of {count} requested URLs")
@@ -280,7 +250,7 @@ def collect_corpus() -> List[Dict]:
     
     # Get 300 new random URLs
     print("\nStep 2: Collecting random URLs...")
-    random_urls = collect_random_urls(config.RANDOM_URLS_COUNT)
+    random_urls = collect_random_urls(config.RANDOM_URLS_COUNT, exclude=fixed_urls)
     print(f"  Collected: {len(random_urls)} random URLs")
     
     # Combine them
@@ -291,11 +261,12 @@ def collect_corpus() -> List[Dict]:
     print("\nStep 3: Extracting article content...")
     corpus = []
     
-    for url in tqdm(all_urls, desc="Extracting"):
-        article = extract_article(url)
-        if article and article['content']:
-            corpus.append(article)
-        time.sleep(0.3)  # Rate limiting
+    # Plain-text extracts in batches of 50 titles (the API's limit), batches fetched
+    # by a bounded pool of threads (the bound doubles as rate limiting), URL order kept
+    batches = [all_urls[i:i + WIKI_API_BATCH] for i in range(0, len(all_urls), WIKI_API_BATCH)]
+    with ThreadPoolExecutor(max_workers=config.COLLECTION_WORKERS) as executor:
+        for articles in tqdm(executor.map(extract_articles_batch, batches), total=len(batches), desc="Extracting"):
+            corpus.extend(articles)
     
     print(f"\nSuccessfully extracted: {len(corpus)} articles")
     
@@ -16,16 +16,15 @@ os.environ['HF_HOME'] = config.CACHE_DIR
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'  # Prevent OpenMP runtime conflict on macOS
 os.environ['TOKENIZERS_PARALLELISM'] = 'false'  # Avoid deadlock during initialization
 # Now safe to import transformer libraries
-if 'HF_TOKEN' in os.environ:
-    print(f"DEBUG: Found HF_TOKEN in environment: {os.environ['HF_TOKEN'][:5]}...")
-else:
-    print("DEBUG: No HF_TOKEN found in environment (Good for public access)")
 import json
+import functools
 import pickle
 import numpy as np
+import torch
 from typing import List, Dict, Tuple
 from sentence_transformers import SentenceTransformer
 import faiss
+from src.chunk_store import ChunkStore
 
 
 class DenseRetriever:
@@ -40,10 +39,15 @@ class DenseRetriever:
         """
         print(f"Loading embedding model: {model_name}")
         # Force token=False to access public model without auth (avoids expired token errors)
-        self.model = SentenceTransformer(model_name, token=False)
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.model = SentenceTransformer(model_name, token=False, device=device)
+        if device == 'cuda':
+            self.model.half()  # FP16 on GPU: half the memory traffic, tensor-core matmuls
         self.index = None
         self.chunks = None
         self.embeddings = None
+        # Repeated queries (e.g. several top_k settings) skip the encoder forward pass
+        self._encode_query = functools.lru_cache(maxsize=config.QUERY_CACHE_SIZE)(self._encode_query_uncached)
     
     def build_index(self, chunks: List[Dict]):
         """
@@ -54,24 +58,48 @@ class DenseRetriever:
         """
         print(f"Building dense index for {len(chunks)} chunks...")
         
-        self.chunks = chunks
+        self.chunks = ChunkStore.from_chunks(chunks)
         texts = [chunk['text'] for chunk in chunks]
         
         # Generate embeddings
         print("Generating embeddings...")
         self.embeddings = self.model.encode(
             texts,
+            batch_size=config.EMBEDDING_BATCH_SIZE,
             show_progress_bar=True,
-            convert_to_numpy=True
-        )
-        
-        # Normalize embeddings for cosine similarity
-        faiss.normalize_L2(self.embeddings)
+            convert_to_numpy=True,
+            normalize_embeddings=True  # Unit vectors for cosine similarity, no second pass
+        ).astype('float32', copy=False)  # FAISS needs float32 (the GPU path encodes in FP16)
         
         # Build FAISS index
         dimension = self.embeddings.shape[1]
-        print(f"Building FAISS index (dimension: {dimension})...")
-        self.index = faiss.IndexFlatIP(dimension)  # Inner product = cosine similarity after normalization
+        if config.EMBEDDING_QUANT == 'sq8' and len(self.embeddings) >= config.FAISS_NLIST * 39:
+            # IVF + int8 scalar quantization: 4x smaller codes, int8 SIMD dot products
+            print(f"Building IVF-SQ8 FAISS index (dimension: {dimension}, nlist: {config.FAISS_NLIST})...")
+            quantizer = faiss.IndexFlatIP(dimension)
+            self.index = faiss.IndexIVFScalarQuantizer(
+                quantizer,
+                dimension,
+                config.FAISS_NLIST,
+                faiss.ScalarQuantizer.QT_8bit,
+                faiss.METRIC_INNER_PRODUCT
+            )
+            self.index.train(self.embeddings)
+            self.index.nprobe = config.FAISS_NPROBE
+        elif config.EMBEDDING_QUANT == 'sq8':
+            # Too few vectors to train IVF: exact scan over int8 codes (4x smaller than FP32)
+            print(f"Building SQ8 FAISS index (dimension: {dimension})...")
+            self.index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+            self.index.train(self.embeddings)
+        elif config.EMBEDDING_QUANT == 'hnsw' and len(self.embeddings) >= config.HNSW_MIN_VECTORS:
+            # Graph search visits ~log N vectors per query instead of scanning all of them
+            print(f"Building HNSW FAISS index (dimension: {dimension}, M: {config.HNSW_M})...")
+            self.index = faiss.IndexHNSWFlat(dimension, config.HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            self.index.hnsw.efConstruction = config.HNSW_EF_CONSTRUCTION
+            self.index.hnsw.efSearch = config.HNSW_EF_SEARCH
+        else:
+            print(f"Building FAISS index (dimension: {dimension})...")
+            self.index = faiss.IndexFlatIP(dimension)  # Inner product = cosine similarity after normalization
         self.index.add(self.embeddings)
         
         print(f"Index built with {self.index.ntotal} vectors")
@@ -90,9 +118,8 @@ class DenseRetriever:
         if self.index is None:
             raise ValueError("Index not built. Call build_index() first.")
         
-        # Encode query
-        query_embedding = self.model.encode([query], convert_to_numpy=True)
-        faiss.normalize_L2(query_embedding)
+        # Encode query (cached per query string)
+        query_embedding = self._encode_query(query)
         
         # Search
         scores, indices = self.index.search(query_embedding, top_k)
@@ -100,12 +127,100 @@ class DenseRetriever:
         # Prepare results
         results = []
         for idx, score in zip(indices[0], scores[0]):
-            chunk = self.chunks[idx].copy()
+            if idx < 0:  # IVF pads with -1 when the probed lists hold fewer than top_k vectors
+                continue
+            chunk = self.chunks[idx]
+            chunk['chunk_index'] = int(idx)  # Position in the chunk store (integer key for RRF)
             chunk['dense_score'] = float(score)
             chunk['rank'] = len(results) + 1
             results.append((chunk, float(score)))
         
         return results
+
+    def _encode_query_uncached(self, query: str) -> np.ndarray:
+        """
+        Encode one query into a normalized (1, dimension) float32 array.
+        The result is shared through the query cache, so it must not be modified.
+        """
+        return self.model.encode(
+            [query], convert_to_numpy=True, normalize_embeddings=True
+        ).astype('float32', copy=False)
+    
+    def search_ids(self, query: str, top_k: int = config.DENSE_TOP_K) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search for similar chunks, returning chunk indices instead of chunk copies.
+        
+        Args:
+            query: Query text
+            top_k: Number of top results to return
+            
+        Returns:
+            Tuple of (indices, scores) arrays of length top_k
+        """
+        scores, indices = self.search_batch([query], top_k=top_k)
+        return indices[0], scores[0]
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Encode queries into unit-normalized float32 embeddings in large batches.
+        
+        Args:
+            queries: List of query texts
+            
+        Returns:
+            Array of shape (len(queries), dimension)
+        """
+        return self.model.encode(
+            queries,
+            batch_size=config.QUERY_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        ).astype('float32')
+    
+    def search_batch(
+        self,
+        queries: List[str],
+        top_k: int = config.DENSE_TOP_K,
+        query_embeddings: np.ndarray = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search for many queries at once with a single encode and FAISS call.
+        
+        Args:
+            queries: List of query texts
+            top_k: Number of top results per query
+            query_embeddings: Optional embeddings from encode_queries() to skip encoding
+            
+        Returns:
+            Tuple of (scores, indices) arrays with shape (len(queries), top_k)
+        """
+        if self.index is None:
+            raise ValueError("Index not built. Call build_index() first.")
+        
+        if query_embeddings is None:
+            query_embeddings = self.encode_queries(queries)
+        
+        # One batched search (matrix-matrix product instead of per-query calls)
+        scores, indices = self.index.search(query_embeddings, top_k)
+        
+        return scores, indices
+    
+    def get_embeddings(self) -> np.ndarray:
+        """
+        Return the indexed vectors, reconstructing them from FAISS on first use
+        after load_index() (approximate for quantized indexes).
+        
+        Returns:
+            Array of shape (ntotal, dimension)
+        """
+        if self.embeddings is None:
+            if self.index is None:
+                raise ValueError("Index not built. Call build_index() first.")
+            ivf_index = faiss.try_extract_index_ivf(self.index)
+            if ivf_index is not None:
+                ivf_index.make_direct_map()  # IVF needs an id -> list map to reconstruct
+            self.embeddings = self.index.reconstruct_n(0, self.index.ntotal)
+        return self.embeddings
     
     def save_index(self, index_path: str = config.VECTOR_INDEX_FILE):
         """
@@ -117,12 +232,11 @@ class DenseRetriever:
         # Save FAISS index
         faiss.write_index(self.index, index_path)
         
-        # Save metadata (chunks and embeddings)
+        # Save metadata (chunk columns only; the vectors live in the FAISS index)
         metadata_path = index_path.replace('.bin', '_metadata.pkl')
         with open(metadata_path, 'wb') as f:
             pickle.dump({
-                'chunks': self.chunks,
-                'embeddings': self.embeddings
+                'chunks': self.chunks.columns
             }, f)
         
         print(f"Dense index saved to {index_path}")
@@ -134,15 +248,29 @@ class DenseRetriever:
         Args:
             index_path: Path to the index file
         """
-        # Load FAISS index
-        self.index = faiss.read_index(index_path)
+        # Load FAISS index (memory-mapped so pages are shared and loaded on demand)
+        if config.FAISS_MMAP:
+            try:
+                self.index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                self.index = faiss.read_index(index_path)
+        else:
+            self.index = faiss.read_index(index_path)
+        
+        # Apply the configured search breadth to IVF/HNSW indexes (no-op for Flat)
+        ivf_index = faiss.try_extract_index_ivf(self.index)
+        if ivf_index is not None:
+            ivf_index.nprobe = config.FAISS_NPROBE
+        elif isinstance(self.index, faiss.IndexHNSW):
+            self.index.hnsw.efSearch = config.HNSW_EF_SEARCH
         
         # Load metadata
         metadata_path = index_path.replace('.bin', '_metadata.pkl')
         with open(metadata_path, 'rb') as f:
             metadata = pickle.load(f)
-            self.chunks = metadata['chunks']
-            self.embeddings = metadata['embeddings']
+            self.chunks = ChunkStore.load(metadata['chunks'])
+        # Vectors stay in the (memory-mapped) index; any copy in older metadata files is dropped
+        self.embeddings = None
         
         print(f"Dense index loaded from {index_path}")
 
@@ -5,6 +5,8 @@ import os
 import sys
 from typing import List, Dict, Tuple
 import pickle
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
 # Fix imports - add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -25,6 +27,18 @@ class HybridRetriever:
         """Initialize hybrid retriever with dense and sparse retrievers."""
         self.dense_retriever = DenseRetriever()
         self.sparse_retriever = SparseRetriever()
+        self.urls = None  # Chunk URLs indexed by chunk position (SoA)
+        # Dense (torch/FAISS) and sparse (NumPy) search release the GIL, so run them side by side
+        self._pool = ThreadPoolExecutor(max_workers=2)
+    
+    def _share_chunks(self):
+        """Point both retrievers at one chunk store (both index the same chunks)."""
+        if len(self.sparse_retriever.chunks) == len(self.dense_retriever.chunks):
+            self.sparse_retriever.chunks = self.dense_retriever.chunks
+    
+    def _build_url_array(self):
+        """Cache chunk URLs in a contiguous array for index-based lookups."""
+        self.urls = np.array(self.dense_retriever.chunks.column('url'), dtype=object)
     
     def build_indices(self, chunks: List[Dict]):
         """
@@ -36,13 +50,16 @@ class HybridRetriever:
         print("Building hybrid retrieval system...")
         self.dense_retriever.build_index(chunks)
         self.sparse_retriever.build_index(chunks)
+        self._share_chunks()
+        self._build_url_array()
         print("Hybrid retrieval system ready!")
     
     def reciprocal_rank_fusion(
         self,
         dense_results: List[Tuple[Dict, float]],
         sparse_results: List[Tuple[Dict, float]],
-        k: int = config.RRF_K
+        k: int = config.RRF_K,
+        final_top_n: int = None
     ) -> List[Tuple[Dict, float]]:
         """
         Combine results using Reciprocal Rank Fusion.
@@ -52,66 +69,55 @@ class HybridRetriever:
             dense_results: Results from dense retrieval
             sparse_results: Results from sparse retrieval
             k: RRF constant (default 60 as per assignment)
+            final_top_n: Keep only this many fused results (None keeps all)
             
         Returns:
             List of (chunk_dict, rrf_score) tuples sorted by RRF score
         """
-        # Create a dictionary to store RRF scores
-        rrf_scores = {}
-        
-        # Process dense results
-        for rank, (chunk, score) in enumerate(dense_results, 1):
-            chunk_id = chunk['chunk_id']
-            if chunk_id not in rrf_scores:
-                rrf_scores[chunk_id] = {
-                    'chunk': chunk,
-                    'rrf_score': 0,
-                    'dense_rank': None,
-                    'sparse_rank': None,
-                    'dense_score': None,
-                    'sparse_score': None
-                }
-            
-            # Add RRF contribution from dense retrieval
-            rrf_scores[chunk_id]['rrf_score'] += 1 / (k + rank)
-            rrf_scores[chunk_id]['dense_rank'] = rank
-            rrf_scores[chunk_id]['dense_score'] = score
-        
-        # Process sparse results
-        for rank, (chunk, score) in enumerate(sparse_results, 1):
-            chunk_id = chunk['chunk_id']
-            if chunk_id not in rrf_scores:
-                rrf_scores[chunk_id] = {
-                    'chunk': chunk,
-                    'rrf_score': 0,
-                    'dense_rank': None,
-                    'sparse_rank': None,
-                    'dense_score': None,
-                    'sparse_score': None
-                }
-            
-            # Add RRF contribution from sparse retrieval
-            rrf_scores[chunk_id]['rrf_score'] += 1 / (k + rank)
-            rrf_scores[chunk_id]['sparse_rank'] = rank
-            rrf_scores[chunk_id]['sparse_score'] = score
-        
-        # Sort by RRF score
-        sorted_results = sorted(
-            rrf_scores.values(),
-            key=lambda x: x['rrf_score'],
-            reverse=True
-        )
+        all_results = list(dense_results) + list(sparse_results)
+        if not all_results:
+            return []
+        
+        # Rank of every entry within its own list; RRF contributions summed per chunk
+        n_dense = len(dense_results)
+        ranks = np.concatenate([np.arange(1, n_dense + 1), np.arange(1, len(sparse_results) + 1)])
+        # Key on the integer chunk_index set by the retrievers (cheap to sort and hash),
+        # falling back to the string chunk_id for results built elsewhere
+        try:
+            keys = np.fromiter((chunk['chunk_index'] for chunk, _ in all_results), dtype=np.int64, count=len(all_results))
+        except KeyError:
+            keys = np.array([chunk['chunk_id'] for chunk, _ in all_results])
+        unique_ids, first_pos, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        rrf_scores = np.zeros(len(unique_ids))
+        np.add.at(rrf_scores, inverse, 1.0 / (k + ranks))
+        
+        # Highest score first; ties keep first appearance (dense before sparse)
+        order = np.lexsort((first_pos, -rrf_scores))
+        # Only the kept results get chunk copies and metadata
+        if final_top_n is not None:
+            order = order[:final_top_n]
+        
+        # Per-retriever rank and score by key
+        key_list = keys.tolist()
+        dense_by_key = {key: (rank, score) for rank, (key, (_, score)) in enumerate(zip(key_list[:n_dense], dense_results), 1)}
+        sparse_by_key = {key: (rank, score) for rank, (key, (_, score)) in enumerate(zip(key_list[n_dense:], sparse_results), 1)}
         
         # Prepare output format
         results = []
-        for item in sorted_results:
-            chunk = item['chunk'].copy()
-            chunk['rrf_score'] = item['rrf_score']
-            chunk['dense_rank'] = item['dense_rank']
-            chunk['sparse_rank'] = item['sparse_rank']
-            chunk['dense_score'] = item['dense_score']
-            chunk['sparse_score'] = item['sparse_score']
-            results.append((chunk, item['rrf_score']))
+        for u in order:
+            source_chunk = all_results[first_pos[u]][0]
+            key = key_list[first_pos[u]]
+            dense_rank, dense_score = dense_by_key.get(key, (None, None))
+            sparse_rank, sparse_score = sparse_by_key.get(key, (None, None))
+            rrf_score = float(rrf_scores[u])
+            
+            chunk = source_chunk.copy()
+            chunk['rrf_score'] = rrf_score
+            chunk['dense_rank'] = dense_rank
+            chunk['sparse_rank'] = sparse_rank
+            chunk['dense_score'] = dense_score
+            chunk['sparse_score'] = sparse_score
+            results.append((chunk, rrf_score))
         
         return results
     
@@ -134,23 +140,20 @@ class HybridRetriever:
         Returns:
             Tuple of (top_n_results, metadata) where metadata contains individual retrieval results
         """
-        # Get dense results
-        dense_results = self.dense_retriever.search(query, top_k=dense_k)
-        
-        # Get sparse results
-        sparse_results = self.sparse_retriever.search(query, top_k=sparse_k)
+        # Get dense and sparse results concurrently
+        dense_future = self._pool.submit(self.dense_retriever.search, query, dense_k)
+        sparse_future = self._pool.submit(self.sparse_retriever.search, query, sparse_k)
+        dense_results = dense_future.result()
+        sparse_results = sparse_future.result()
         
-        # Apply RRF
-        rrf_results = self.reciprocal_rank_fusion(dense_results, sparse_results)
-        
-        # Take top N
-        top_n_results = rrf_results[:final_top_n]
+        # Apply RRF, materializing only the top N
+        top_n_results = self.reciprocal_rank_fusion(dense_results, sparse_results, final_top_n=final_top_n)
         
         # Prepare metadata
         metadata = {
             'dense_results': dense_results,
             'sparse_results': sparse_results,
-            'rrf_results': rrf_results,
+            'rrf_results': top_n_results,
             'dense_k': dense_k,
             'sparse_k': sparse_k,
             'final_top_n': final_top_n
@@ -158,6 +161,112 @@ class HybridRetriever:
         
         return top_n_results, metadata
     
+    @staticmethod
+    def results_to_arrays(results: List[Tuple[Dict, float]]) -> Dict[str, np.ndarray]:
+        """
+        Convert fused results into parallel arrays (struct-of-arrays) so
+        downstream consumers index by rank instead of probing chunk dicts.
+        
+        Args:
+            results: List of (chunk_dict, rrf_score) tuples from search()
+            
+        Returns:
+            Dictionary of arrays: urls, titles (object), rrf_scores,
+            dense_ranks, sparse_ranks (float, NaN where a retriever missed)
+        """
+        n = len(results)
+        arrays = {
+            'urls': np.empty(n, dtype=object),
+            'titles': np.empty(n, dtype=object),
+            'rrf_scores': np.empty(n, dtype=np.float64),
+            'dense_ranks': np.full(n, np.nan),
+            'sparse_ranks': np.full(n, np.nan)
+        }
+        for i, (chunk, _) in enumerate(results):
+            arrays['urls'][i] = chunk['url']
+            arrays['titles'][i] = chunk['title']
+            arrays['rrf_scores'][i] = chunk.get('rrf_score', 0)
+            if chunk.get('dense_rank') is not None:
+                arrays['dense_ranks'][i] = chunk['dense_rank']
+            if chunk.get('sparse_rank') is not None:
+                arrays['sparse_ranks'][i] = chunk['sparse_rank']
+        return arrays
+    
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Encode all queries with the dense encoder in one batched pass.
+        
+        Args:
+            queries: List of query texts
+            
+        Returns:
+            Normalized (len(queries), dimension) embedding matrix
+        """
+        return self.dense_retriever.encode_queries(queries)
+    
+    def batch_search(
+        self,
+        queries: List[str],
+        dense_k: int = config.DENSE_TOP_K,
+        sparse_k: int = config.SPARSE_TOP_K,
+        final_top_n: int = config.FINAL_TOP_N,
+        query_embeddings: np.ndarray = None
+    ) -> List[Tuple[List[Tuple[Dict, float]], Dict]]:
+        """
+        Hybrid search for many queries with one encoder forward pass and
+        one FAISS search, fused per query exactly as search() does.
+        
+        Args:
+            queries: List of query texts
+            dense_k: Number of results from dense retrieval
+            sparse_k: Number of results from sparse retrieval
+            final_top_n: Final number of results to return after RRF
+            query_embeddings: Optional embeddings from encode_queries() to skip encoding
+            
+        Returns:
+            List of (top_n_results, metadata) tuples, one per query
+        """
+        dense_scores, dense_ids = self.dense_retriever.search_batch(
+            queries, top_k=dense_k, query_embeddings=query_embeddings
+        )
+        sparse_ids, sparse_scores = self.sparse_retriever.batch_search(queries, top_k=sparse_k)
+        
+        batch_results = []
+        for q_dense_ids, q_dense_scores, q_sparse_ids, q_sparse_scores in zip(
+            dense_ids, dense_scores, sparse_ids, sparse_scores
+        ):
+            dense_results = []
+            for idx, score in zip(q_dense_ids, q_dense_scores):
+                if idx < 0:  # FAISS pads missing results with -1
+                    continue
+                chunk = self.dense_retriever.chunks[idx]
+                chunk['chunk_index'] = int(idx)
+                chunk['dense_score'] = float(score)
+                chunk['rank'] = len(dense_results) + 1
+                dense_results.append((chunk, float(score)))
+            
+            sparse_results = []
+            for rank, (idx, score) in enumerate(zip(q_sparse_ids, q_sparse_scores), 1):
+                chunk = self.sparse_retriever.chunks[idx]
+                chunk['chunk_index'] = int(idx)
+                chunk['sparse_score'] = float(score)
+                chunk['rank'] = rank
+                sparse_results.append((chunk, float(score)))
+            
+            top_n_results = self.reciprocal_rank_fusion(dense_results, sparse_results, final_top_n=final_top_n)
+            
+            metadata = {
+                'dense_results': dense_results,
+                'sparse_results': sparse_results,
+                'rrf_results': top_n_results,
+                'dense_k': dense_k,
+                'sparse_k': sparse_k,
+                'final_top_n': final_top_n
+            }
+            batch_results.append((top_n_results, metadata))
+        
+        return batch_results
+    
     def save_indices(
         self,
         vector_path: str = config.VECTOR_INDEX_FILE,
@@ -187,11 +296,13 @@ class HybridRetriever:
         """
         self.dense_retriever.load_index(vector_path)
         self.sparse_retriever.load_index(bm25_path)
+        self._share_chunks()
+        self._build_url_array()
 
 
-if __name__ == "__main__":
-    # Test hybrid retrieval
-    from preprocessing import load_chunks
+def main():
+    """Build, save and smoke-test the hybrid retrieval indices."""
+    from src.preprocessing import load_chunks
     
     # Load chunks
     chunks = load_chunks()
@@ -216,3 +327,7 @@ if __name__ == "__main__":
         print(f"   Title: {chunk['title']}")
         print(f"   URL: {chunk['url']}")
         print(f"   Text: {chunk['text'][:150]}...")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,11 +16,80 @@ if config.HF_TOKEN:
     os.environ['HF_TOKEN'] = config.HF_TOKEN
 
 # Now safe to import transformer libraries
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, BitsAndBytesConfig
 import torch
+import functools
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
 from typing import List, Dict, Tuple
 import time
 
+try:
+    import bitsandbytes  # Needed only for PRECISION = 'int8'
+except ImportError:
+    bitsandbytes = None
+
+# Instruction text that starts every prompt; its token ids are computed once
+PROMPT_PREFIX = """You are a helpful assistant. Answer the question precisely based ONLY on the provided context documents. 
+If the information is not present in the context, state that the information is not available.
+
+Context Documents:
+"""
+# Text after the context documents
+PROMPT_SUFFIX = """
+
+Question: {query}
+
+Please provide a clear and concise answer:"""
+MAX_INPUT_TOKENS = 1024  # Encoder input limit (longer prompts are truncated at the end)
+
+_TOKENIZER_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=4)
+def _get_tokenizer(model_name: str):
+    """Load the (Rust-backed) fast tokenizer once per model name."""
+    tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True, token=False)
+    if not tokenizer.is_fast:
+        print(f"Warning: no fast tokenizer available for {model_name}; using the slow Python one")
+    return tokenizer
+
+
+@functools.lru_cache(maxsize=4)
+def _get_model(model_name: str, precision: str, device: str):
+    """
+    Load the model once per (name, precision, device), ready for inference.
+    
+    Args:
+        model_name: Hugging Face model name
+        precision: 'fp32', 'bf16' or 'int8' (already checked as supported)
+        device: 'cuda' or 'cpu'
+        
+    Returns:
+        Model in eval mode on the device
+    """
+    load_kwargs = {'token': False}
+    if precision == 'int8':
+        # 8-bit weights via bitsandbytes; placed on the GPU while loading
+        load_kwargs['quantization_config'] = BitsAndBytesConfig(load_in_8bit=True)
+        load_kwargs['device_map'] = "auto"
+    elif precision == 'bf16':
+        # T5 was trained in bf16, so unlike fp16 its activations do not overflow
+        load_kwargs['dtype'] = torch.bfloat16
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name, **load_kwargs)
+    if precision != 'int8':
+        model.to(device)
+    model.eval()
+    # Reuse decoder keys/values across decoding steps instead of recomputing them
+    model.config.use_cache = True
+    if config.COMPILE_MODEL:
+        # Compile the forward pass generate() runs every decoding step (fused
+        # kernels, CUDA graphs); the first calls for each input shape pay the compile cost
+        model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False)
+    return model
+
 
 class ResponseGenerator:
     # Generates answers using LLM with retrieved chunks as context
@@ -29,14 +98,65 @@ class ResponseGenerator:
         # Load the language model for generation        
         print(f"Loading LLM model: {model_name}")
         self.model_name = model_name
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name, token=False)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name, token=False)
+        self.tokenizer = _get_tokenizer(model_name)
         
         # Check if GPU is available and use it
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model.to(self.device)
+        self.precision = self._resolve_precision(config.PRECISION)
+        self.model = _get_model(model_name, self.precision, self.device)
+        
+        # Fast tokenizers are not safe to call from several threads at once
+        # (one lock per process, as generators of the same model share a tokenizer)
+        self._tokenizer_lock = _TOKENIZER_LOCK
+        
+        # The tokenizer splits on whitespace first, so the fixed prefix (which ends
+        # in a newline) tokenizes the same alone as inside the full prompt
+        self._prefix_ids = self.tokenizer(PROMPT_PREFIX, add_special_tokens=False)['input_ids']
         
-        print(f"Model loaded on {self.device}")
+        # LRU of generated answers keyed by (query, retrieved chunk ids, max_length)
+        self._answer_cache = OrderedDict()
+        self._answer_cache_lock = threading.Lock()
+        
+        print(f"Model loaded on {self.device} ({self.precision})")
+    
+    def _resolve_precision(self, precision: str) -> str:
+        """
+        Fall back from the configured precision to one this machine supports.
+        
+        Args:
+            precision: 'fp32', 'bf16' or 'int8'
+            
+        Returns:
+            Precision the model will be loaded in
+        """
+        if precision == 'int8' and (self.device != "cuda" or bitsandbytes is None):
+            print("int8 needs a CUDA GPU and bitsandbytes; using bf16 instead")
+            precision = 'bf16'
+        if precision == 'bf16':
+            if self.device == "cuda":
+                supported = torch.cuda.is_bf16_supported()
+            else:
+                # Without AVX-512, CPU bf16 matmuls are emulated and slower than fp32
+                supported = torch.backends.cpu.get_cpu_capability() == "AVX512"
+            if not supported:
+                precision = 'fp32'
+        return precision
+    
+    def format_documents(self, chunks: List[Tuple[Dict, float]]) -> List[str]:
+        """
+        Format each retrieved chunk as a numbered context document.
+        
+        Args:
+            chunks: List of (chunk_dict, score) tuples
+            
+        Returns:
+            List of document strings, in rank order
+        """
+        # Include title and text with clearer source separation
+        return [
+            f"Document {i} (Source: {chunk['title']}):\n{chunk['text']}"
+            for i, (chunk, score) in enumerate(chunks, 1)
+        ]
     
     def format_context(self, chunks: List[Tuple[Dict, float]]) -> str:
         """
@@ -48,15 +168,7 @@ class ResponseGenerator:
         Returns:
             Formatted context string
         """
-        context_parts = []
-        
-        for i, (chunk, score) in enumerate(chunks, 1):
-            # Include title and text with clearer source separation
-            context_parts.append(
-                f"Document {i} (Source: {chunk['title']}):\n{chunk['text']}"
-            )
-        
-        return "\n\n".join(context_parts)
+        return "\n\n".join(self.format_documents(chunks))
     
     def generate_answer(
         self,
@@ -75,44 +187,168 @@ class ResponseGenerator:
         Returns:
             Dictionary with answer and metadata
         """
-        start_time = time.time()
+        return self.generate_answers([query], [retrieved_chunks], max_length)[0]
+    
+    def generate_answers(
+        self,
+        queries: List[str],
+        retrieved_chunks_list: List[List[Tuple[Dict, float]]],
+        max_length: int = config.MAX_GEN_LENGTH
+    ) -> List[Dict]:
+        """
+        Generate answers for several queries with a single generate() call.
+        
+        Args:
+            queries: User questions
+            retrieved_chunks_list: Retrieved (chunk_dict, score) tuples for each question
+            max_length: Maximum length of each generated answer
+            
+        Returns:
+            List of answer dictionaries, in query order
+        """
+        start_time = time.perf_counter()
+        results = [None] * len(queries)
+        pending = []  # (position, cache key, query, retrieved chunks)
         
-        # Format context
-        context = self.format_context(retrieved_chunks)
+        for position, (query, retrieved_chunks) in enumerate(zip(queries, retrieved_chunks_list)):
+            # Same question over the same chunks: reuse the earlier answer
+            cache_key = (query, tuple(chunk['chunk_id'] for chunk, _ in retrieved_chunks), max_length)
+            with self._answer_cache_lock:
+                cached = self._answer_cache.get(cache_key)
+                if cached is not None:
+                    self._answer_cache.move_to_end(cache_key)
+            if cached is not None:
+                results[position] = {**cached, 'generation_time': time.perf_counter() - start_time}
+            else:
+                pending.append((position, cache_key, query, retrieved_chunks))
         
-        # Create prompt
-        prompt = self.create_prompt(query, context)
+        if not pending:
+            return results
         
-        # Generate answer
-        inputs = self.tokenizer(
-            prompt,
-            return_tensors="pt",
-            max_length=1024,
-            truncation=True
-        ).to(self.device)
+        # Format context documents and the question that follows them
+        documents = [self.format_documents(retrieved_chunks) for _, _, _, retrieved_chunks in pending]
+        tails = [PROMPT_SUFFIX.format(query=query) for _, _, query, _ in pending]
         
-        with torch.no_grad():
+        # Tokenize every document and question in one call. The pieces meet at
+        # whitespace, so their ids concatenate to the ids of the full prompt
+        # (the cached prefix is never re-tokenized)
+        prompt_ids, contexts, chunk_counts = [], [], []
+        with self._tokenizer_lock:
+            piece_ids = self.tokenizer(
+                [document for docs in documents for document in docs] + tails,
+                add_special_tokens=False
+            )['input_ids']
+            start = 0
+            for docs, tail_ids in zip(documents, piece_ids[-len(pending):]):
+                ids, context, num_chunks = self._fit_context(docs, piece_ids[start:start + len(docs)], tail_ids)
+                start += len(docs)
+                prompt_ids.append(ids)
+                contexts.append(context)
+                chunk_counts.append(num_chunks)
+        inputs = self._prepare_inputs(prompt_ids)
+        
+        # Deterministic beam/greedy decoding, so no sampling temperature
+        with torch.inference_mode():
             outputs = self.model.generate(
                 **inputs,
                 max_length=max_length,
-                num_beams=4,
-                early_stopping=True,
-                temperature=config.TEMPERATURE
+                num_beams=config.NUM_BEAMS,
+                early_stopping=config.NUM_BEAMS > 1,
+                use_cache=True,
+                pad_token_id=self.tokenizer.pad_token_id
             )
         
-        answer = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+        with self._tokenizer_lock:
+            answers = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        
+        generation_time = time.perf_counter() - start_time
+        
+        for (position, cache_key, query, _), context, num_chunks, answer in zip(pending, contexts, chunk_counts, answers):
+            result = {
+                'answer': answer,
+                'query': query,
+                'context': context,
+                'num_chunks_used': num_chunks,
+                'generation_time': generation_time,
+                'model': self.model_name
+            }
+            results[position] = result
+            
+            with self._answer_cache_lock:
+                self._answer_cache[cache_key] = result
+                if len(self._answer_cache) > config.ANSWER_CACHE_SIZE:
+                    self._answer_cache.popitem(last=False)
+        
+        return results
+    
+    def _fit_context(
+        self,
+        documents: List[str],
+        document_ids: List[List[int]],
+        tail_ids: List[int]
+    ) -> Tuple[List[int], str, int]:
+        """
+        Keep as many context documents as fit in the encoder input, truncating
+        the last one, so the question at the end of the prompt is never cut off.
+        Call with the tokenizer lock held.
+        
+        Args:
+            documents: Formatted context documents, in rank order
+            document_ids: Token ids of each document
+            tail_ids: Token ids of the question text after the context
+            
+        Returns:
+            Tuple of (prompt token ids, context string, number of documents used)
+        """
+        budget = MAX_INPUT_TOKENS - 1 - len(self._prefix_ids) - len(tail_ids)  # 1 for EOS
+        context_ids = []
+        context_parts = []
+        for document, ids in zip(documents, document_ids):
+            remaining = budget - len(context_ids)
+            if remaining <= 0:
+                break
+            if len(ids) > remaining:
+                ids = ids[:remaining]
+                document = self.tokenizer.decode(ids, skip_special_tokens=True)
+            context_ids.extend(ids)
+            context_parts.append(document)
+        
+        return self._prefix_ids + context_ids + tail_ids, "\n\n".join(context_parts), len(context_parts)
+    
+    def _prepare_inputs(self, batch_token_ids: List[List[int]]) -> Dict[str, torch.Tensor]:
+        """
+        Build padded model inputs from prompt token ids, truncated like the tokenizer would.
+        
+        Args:
+            batch_token_ids: Prompt token ids (without special tokens) for each sequence
+            
+        Returns:
+            Dictionary with int32 'input_ids' and 'attention_mask' on the model device
+        """
+        batch_token_ids = [ids[:MAX_INPUT_TOKENS - 1] + [self.tokenizer.eos_token_id] for ids in batch_token_ids]
+        width = max(len(ids) for ids in batch_token_ids)
         
-        generation_time = time.time() - start_time
+        # Right-pad to a common length; the mask hides the padding from the encoder
+        input_ids = torch.full((len(batch_token_ids), width), self.tokenizer.pad_token_id, dtype=torch.int32)  # Half the bytes of int64
+        attention_mask = torch.zeros((len(batch_token_ids), width), dtype=torch.int32)
+        for row, ids in enumerate(batch_token_ids):
+            input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.int32)
+            attention_mask[row, :len(ids)] = 1
         
+        if self.device == "cuda":
+            # Page-locked host memory lets the copy to the GPU run asynchronously
+            input_ids = input_ids.pin_memory()
+            attention_mask = attention_mask.pin_memory()
         return {
-            'answer': answer,
-            'query': query,
-            'context': context,
-            'num_chunks_used': len(retrieved_chunks),
-            'generation_time': generation_time,
-            'model': self.model_name
+            'input_ids': input_ids.to(self.device, non_blocking=True),
+            'attention_mask': attention_mask.to(self.device, non_blocking=True)
         }
     
+    def clear_cache(self):
+        """Drop all cached answers."""
+        with self._answer_cache_lock:
+            self._answer_cache.clear()
+    
     def create_prompt(self, query: str, context: str) -> str:
         """
         Create prompt for the LLM.
@@ -124,17 +360,75 @@ class ResponseGenerator:
         Returns:
             Formatted prompt
         """
-        prompt = f"""You are a helpful assistant. Answer the question precisely based ONLY on the provided context documents. 
-If the information is not present in the context, state that the information is not available.
-
-Context Documents:
-{context}
+        prompt = PROMPT_PREFIX + context + PROMPT_SUFFIX.format(query=query)
+        
+        return prompt
 
-Question: {query}
 
-Please provide a clear and concise answer:"""
+class GenerationBatcher:
+    # Collects concurrent generate_answer() calls and decodes them in one batch
+    
+    def __init__(
+        self,
+        generator: ResponseGenerator,
+        max_batch: int = config.GENERATION_MAX_BATCH,
+        max_wait_ms: float = config.GENERATION_MAX_WAIT_MS
+    ):
+        """
+        Start the background batching thread.
         
-        return prompt
+        Args:
+            generator: ResponseGenerator that runs the batched generation
+            max_batch: Most requests decoded together
+            max_wait_ms: How long the first request waits for others to join its batch
+        """
+        self.generator = generator
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="generation-batcher", daemon=True)
+        self._worker.start()
+    
+    def generate_answer(self, query: str, retrieved_chunks: List[Tuple[Dict, float]]) -> Dict:
+        """
+        Queue one request and block until its batch has been generated.
+        
+        Args:
+            query: User's question
+            retrieved_chunks: List of (chunk_dict, score) tuples
+            
+        Returns:
+            Dictionary with answer and metadata (as ResponseGenerator.generate_answer)
+        """
+        future = Future()
+        self._requests.put((query, retrieved_chunks, future))
+        return future.result()
+    
+    def _run(self):
+        """Worker loop: gather up to max_batch requests, generate, resolve their futures."""
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            try:
+                results = self.generator.generate_answers(
+                    [query for query, _, _ in batch],
+                    [retrieved_chunks for _, retrieved_chunks, _ in batch]
+                )
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, _, future), result in zip(batch, results):
+                    future.set_result(result)
 
 
 if __name__ == "__main__":
@@ -4,18 +4,42 @@ Handles text chunking with overlap and metadata management
 """
 
 import os
+import re
 import sys
 import json
 import pickle
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import tiktoken
 from typing import List, Dict
 import nltk
 from nltk.tokenize import sent_tokenize
 
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib serializer
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet storage is optional; JSON is always written
+    pa = pq = None
+
 # Fix imports - add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
 
+# Sentence boundary: ., ? or ! followed by whitespace and a capital letter
+_SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z])')
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = "cl100k_base") -> tiktoken.Encoding:
+    """Return the tiktoken encoding, constructed once per process on first use."""
+    return tiktoken.get_encoding(encoding_name)
+
 
 def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
     """
@@ -28,15 +52,15 @@ def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
     Returns:
         Number of tokens
     """
-    encoding = tiktoken.get_encoding(encoding_name)
-    return len(encoding.encode(text))
+    return len(get_encoding(encoding_name).encode(text))
 
 
 def chunk_text_with_overlap(
     text: str,
     min_tokens: int = config.MIN_CHUNK_TOKENS,
     max_tokens: int = config.MAX_CHUNK_TOKENS,
-    overlap_tokens: int = config.CHUNK_OVERLAP_TOKENS
+    overlap_tokens: int = config.CHUNK_OVERLAP_TOKENS,
+    num_threads: int = None
 ) -> List[str]:
     """
     Chunk text with token-based splitting and overlap.
@@ -47,6 +71,7 @@ def chunk_text_with_overlap(
         min_tokens: Minimum tokens per chunk
         max_tokens: Maximum tokens per chunk
         overlap_tokens: Number of tokens to overlap between chunks
+        num_threads: Tokenizer threads (None = one per CPU core)
         
     Returns:
         List of text chunks
@@ -56,41 +81,40 @@ def chunk_text_with_overlap(
     
     chunks = []
     current_chunk = []
+    current_counts = []  # Token count of each sentence in current_chunk
     current_tokens = 0
     
-    encoding = tiktoken.get_encoding("cl100k_base")
+    # Encode every sentence once in a single batched call; the counts are
+    # reused for both chunk sizing and the overlap computation
+    num_threads = num_threads or os.cpu_count() or 1
+    sentence_counts = [len(tokens) for tokens in get_encoding().encode_batch(sentences, num_threads=num_threads)]
     
-    for sentence in sentences:
-        sentence_tokens = len(encoding.encode(sentence))
-        
+    for sentence, sentence_tokens in zip(sentences, sentence_counts):
         # If current chunk + this sentence exceeds max, save current chunk
         if current_tokens + sentence_tokens > max_tokens and current_chunk:
             # Only save if we have at least min_tokens
             if current_tokens >= min_tokens:
                 chunks.append(' '.join(current_chunk))
                 
-                # Start new chunk with overlap
-                overlap_text = ' '.join(current_chunk)
-                overlap_chunk_tokens = len(encoding.encode(overlap_text))
-                
                 # Take sentences from the end for overlap
-                overlap_sentences = []
+                overlap_start = len(current_chunk)
                 overlap_token_count = 0
-                for s in reversed(current_chunk):
-                    s_tokens = len(encoding.encode(s))
+                for s_tokens in reversed(current_counts):
                     if overlap_token_count + s_tokens <= overlap_tokens:
-                        overlap_sentences.insert(0, s)
+                        overlap_start -= 1
                         overlap_token_count += s_tokens
                     else:
                         break
                 
-                current_chunk = overlap_sentences
+                current_chunk = current_chunk[overlap_start:]
+                current_counts = current_counts[overlap_start:]
                 current_tokens = overlap_token_count
             else:
                 # Current chunk is too small, keep adding
                 pass
         
         current_chunk.append(sentence)
+        current_counts.append(sentence_tokens)
         current_tokens += sentence_tokens
     
     # Add the last chunk if it meets minimum requirements
@@ -110,11 +134,9 @@ def split_into_sentences(text: str) -> List[str]:
     Returns:
         List of sentences
     """
-    import re
-    
     # Simple sentence splitting on periods, question marks, exclamation marks
     # followed by whitespace and a capital letter
-    sentences = re.split(r'(?<=[.!?])\s+(?=[A-Z])', text)
+    sentences = _SENTENCE_BOUNDARY_RE.split(text)
     
     # Filter out empty strings
     sentences = [s.strip() for s in sentences if s.strip()]
@@ -122,9 +144,43 @@ def split_into_sentences(text: str) -> List[str]:
     return sentences
 
 
+def _chunk_one_article(article: Dict[str, str], num_threads: int = None) -> List[Dict]:
+    """
+    Chunk a single article (runs in a worker process).
+    
+    Args:
+        article: Article dictionary with 'title', 'content', 'url'
+        num_threads: Tokenizer threads (None = one per CPU core)
+        
+    Returns:
+        List of chunk dictionaries without 'chunk_id' (assigned by the caller)
+    """
+    content = article['content']
+    
+    # Skip articles with no content
+    if not content:
+        return []
+    
+    # Chunk the content
+    chunks = chunk_text_with_overlap(content, num_threads=num_threads)
+    
+    # Add metadata to each chunk
+    return [
+        {
+            'text': chunk_text,
+            'title': article['title'],
+            'url': article['url'],
+            'position': position,  # Position within the article
+            'total_chunks': len(chunks),  # Total chunks for this article
+            'token_count': count_tokens(chunk_text)
+        }
+        for position, chunk_text in enumerate(chunks)
+    ]
+
+
 def create_chunks_with_metadata(corpus: List[Dict[str, str]]) -> List[Dict]:
     """
-    Create chunks from corpus with metadata.
+    Create chunks from corpus with metadata, chunking articles in parallel.
     
     Args:
         corpus: List of article dictionaries with 'title', 'content', 'url'
@@ -132,55 +188,69 @@ def create_chunks_with_metadata(corpus: List[Dict[str, str]]) -> List[Dict]:
     Returns:
         List of chunk dictionaries with metadata
     """
-    all_chunks = []
-    chunk_id = 0
+    workers = config.PREPROCESSING_WORKERS or os.cpu_count() or 1
+    if workers > 1 and len(corpus) > 1:
+        # Articles are independent, so each worker process chunks its own share;
+        # one tokenizer thread per worker, as the processes already use every core
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                per_article = list(executor.map(
+                    functools.partial(_chunk_one_article, num_threads=1),
+                    corpus,
+                    chunksize=max(1, len(corpus) // (workers * 4))
+                ))
+        except (BrokenProcessPool, OSError) as e:
+            print(f"Parallel chunking unavailable ({e}), chunking serially...")
+            per_article = [_chunk_one_article(article) for article in corpus]
+    else:
+        per_article = [_chunk_one_article(article) for article in corpus]
     
-    for article in corpus:
-        title = article['title']
-        content = article['content']
-        url = article['url']
-        
-        # Skip articles with no content
-        if not content:
-            continue
-        
-        # Chunk the content
-        chunks = chunk_text_with_overlap(content)
-        
-        # Add metadata to each chunk
-        for position, chunk_text in enumerate(chunks):
-            chunk_data = {
-                'chunk_id': f"chunk_{chunk_id}",
-                'text': chunk_text,
-                'title': title,
-                'url': url,
-                'position': position,  # Position within the article
-                'total_chunks': len(chunks),  # Total chunks for this article
-                'token_count': count_tokens(chunk_text)
-            }
-            all_chunks.append(chunk_data)
-            chunk_id += 1
+    # Number chunks in corpus order, as the serial loop did
+    all_chunks = []
+    for article_chunks in per_article:
+        for chunk in article_chunks:
+            all_chunks.append({'chunk_id': f"chunk_{len(all_chunks)}", **chunk})
     
     return all_chunks
 
 
 def save_chunks(chunks: List[Dict], filepath: str = config.CHUNKS_FILE):
     """
-    Save chunks to JSON file.
+    Save chunks to JSON file, plus a columnar Parquet copy when pyarrow is available.
     
     Args:
         chunks: List of chunk dictionaries
         filepath: Path to save the JSON file
     """
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(chunks, f, indent=2, ensure_ascii=False)
+    # Compact JSON: indentation made the file ~1.5x larger and slower to parse
+    if orjson is not None:
+        with open(filepath, 'wb') as f:
+            f.write(orjson.dumps(chunks))
+    else:
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(chunks, f, ensure_ascii=False, separators=(',', ':'))
     
     print(f"Saved {len(chunks)} chunks to {filepath}")
+    
+    if pq is not None and filepath == config.CHUNKS_FILE:
+        pq.write_table(pa.Table.from_pylist(chunks), config.CHUNKS_PARQUET_FILE)
+        print(f"Saved columnar chunks to {config.CHUNKS_PARQUET_FILE}")
+
+
+def _parquet_is_current(filepath: str) -> bool:
+    """Check whether the Parquet copy exists and is not older than the JSON file."""
+    if pq is None or filepath != config.CHUNKS_FILE:
+        return False
+    if not os.path.exists(config.CHUNKS_PARQUET_FILE):
+        return False
+    if not os.path.exists(filepath):
+        return True
+    return os.path.getmtime(config.CHUNKS_PARQUET_FILE) >= os.path.getmtime(filepath)
 
 
 def load_chunks(filepath: str = config.CHUNKS_FILE) -> List[Dict]:
     """
-    Load chunks from JSON file.
+    Load chunks, reading the Parquet copy when it is current.
     
     Args:
         filepath: Path to the JSON file
@@ -188,12 +258,33 @@ def load_chunks(filepath: str = config.CHUNKS_FILE) -> List[Dict]:
     Returns:
         List of chunk dictionaries
     """
-    with open(filepath, 'r', encoding='utf-8') as f:
-        chunks = json.load(f)
+    if _parquet_is_current(filepath):
+        return pq.read_table(config.CHUNKS_PARQUET_FILE).to_pylist()
+    
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    chunks = orjson.loads(raw) if orjson is not None else json.loads(raw)
     
     return chunks
 
 
+def load_chunk_column(column: str, filepath: str = config.CHUNKS_FILE) -> List:
+    """
+    Load a single chunk field (e.g. 'url') without materializing full chunks.
+    
+    Args:
+        column: Chunk field to load
+        filepath: Path to the JSON file
+        
+    Returns:
+        List of values for that field, in chunk order
+    """
+    if _parquet_is_current(filepath):
+        return pq.read_table(config.CHUNKS_PARQUET_FILE, columns=[column]).column(column).to_pylist()
+    
+    return [chunk[column] for chunk in load_chunks(filepath)]
+
+
 def preprocess_corpus(corpus: List[Dict[str, str]]) -> List[Dict]:
     """
     Full preprocessing pipeline: take corpus and create chunks with metadata.
@@ -226,10 +317,8 @@ def preprocess_corpus(corpus: List[Dict[str, str]]) -> List[Dict]:
     return chunks
 
 
-if __name__ == "__main__":
-    # Test preprocessing on existing corpus
-    import pickle
-    
+def main():
+    """Chunk the collected corpus and save the chunks."""
     # Load corpus
     with open(config.CORPUS_FILE, 'rb') as f:
         corpus = pickle.load(f)
@@ -241,3 +330,7 @@ if __name__ == "__main__":
     print("\n" + "="*70)
     print("Next step: python src/hybrid_retrieval.py")
     print("="*70)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,22 +6,46 @@ import os
 import sys
 import json
 import pickle
+import functools
+import numpy as np
+import scipy.sparse as sp
 from typing import List, Dict, Tuple
-from rank_bm25 import BM25Okapi
 
 # Fix imports - add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
+from src.chunk_store import ChunkStore
+
+
+class _RankBM25Placeholder:
+    """Stands in for the rank_bm25 object stored in older index files (rebuilt on load)."""
+
+
+class _IndexUnpickler(pickle.Unpickler):
+    """Unpickler that reads older index files without rank_bm25 installed."""
+    
+    def find_class(self, module: str, name: str):
+        if module.split('.')[0] == 'rank_bm25':
+            return _RankBM25Placeholder
+        return super().find_class(module, name)
 
 
 class SparseRetriever:
-    """Sparse keyword retrieval using BM25 algorithm."""
+    """
+    Sparse keyword retrieval using BM25 algorithm.
+    
+    Scores match rank_bm25's BM25Okapi, computed from a sparse term-frequency
+    matrix so each query touches only the postings of its own terms.
+    """
     
     def __init__(self):
         """Initialize the sparse retriever."""
-        self.bm25 = None
         self.chunks = None
-        self.tokenized_chunks = None
+        self.vocabulary = None  # token -> column in term_matrix
+        self.term_matrix = None  # CSC (num_chunks, vocabulary size) term frequencies
+        self.idf = None
+        self.doc_len = None  # Tokens per chunk
+        self.length_norm = None  # k1 * (1 - b + b * doc_len / avgdl) per chunk
     
     def tokenize(self, text: str) -> List[str]:
         """
@@ -35,6 +59,20 @@ class SparseRetriever:
         """
         return text.lower().split()
     
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def tokenize_query(query: str) -> Tuple[str, ...]:
+        """
+        Tokenize a query, caching results for repeated queries.
+        
+        Args:
+            query: Query text
+            
+        Returns:
+            Tuple of tokens (immutable so cached values can be shared)
+        """
+        return tuple(query.lower().split())
+    
     def build_index(self, chunks: List[Dict]):
         """
         Build BM25 index from chunks.
@@ -44,15 +82,78 @@ class SparseRetriever:
         """
         print(f"Building BM25 index for {len(chunks)} chunks...")
         
-        self.chunks = chunks
+        self.chunks = ChunkStore.from_chunks(chunks)
         
         # Tokenize all chunks
-        self.tokenized_chunks = [self.tokenize(chunk['text']) for chunk in chunks]
+        tokenized_chunks = [self.tokenize(chunk['text']) for chunk in chunks]
         
         # Build BM25 index
-        self.bm25 = BM25Okapi(self.tokenized_chunks)
+        self._build_term_matrix(tokenized_chunks)
         
-        print(f"BM25 index built with {len(self.tokenized_chunks)} documents")
+        print(f"BM25 index built with {self.term_matrix.shape[0]} documents")
+    
+    def _build_term_matrix(self, tokenized_chunks: List[List[str]]):
+        """
+        Build the term-frequency matrix and BM25Okapi statistics.
+        
+        Args:
+            tokenized_chunks: Token list for each chunk
+        """
+        vocabulary = {}
+        columns = []
+        indptr = [0]
+        for tokens in tokenized_chunks:
+            columns.extend(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+            indptr.append(len(columns))
+        
+        num_docs = len(tokenized_chunks)
+        counts = sp.csr_matrix(
+            (np.ones(len(columns), dtype=np.float32), np.array(columns, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(num_docs, len(vocabulary))
+        )
+        counts.sum_duplicates()  # One entry per (chunk, term) holding its count
+        
+        doc_len = np.diff(indptr)
+        avgdl = doc_len.sum() / num_docs
+        df = np.bincount(counts.indices, minlength=len(vocabulary))
+        idf = np.log(num_docs - df + 0.5) - np.log(df + 0.5)
+        # As in BM25Okapi, terms in over half the chunks get a small positive idf
+        idf[idf < 0] = config.BM25_EPSILON * idf.mean()
+        
+        self.vocabulary = vocabulary
+        self.term_matrix = counts.tocsc()  # Column slices = postings per term
+        self.idf = idf
+        self._set_doc_len(doc_len)
+    
+    def _set_doc_len(self, doc_len: np.ndarray):
+        """Store chunk lengths and the BM25 length normalization derived from them."""
+        self.doc_len = doc_len
+        avgdl = doc_len.sum() / len(doc_len)
+        self.length_norm = config.BM25_K1 * (1 - config.BM25_B + config.BM25_B * doc_len / avgdl)
+    
+    def get_scores(self, query_tokens: Tuple[str, ...]) -> np.ndarray:
+        """
+        Compute BM25 scores of every chunk for a tokenized query.
+        
+        Args:
+            query_tokens: Query tokens (repeated tokens count once per occurrence)
+            
+        Returns:
+            Array of scores, one per chunk
+        """
+        num_docs = self.term_matrix.shape[0]
+        cols = [self.vocabulary[token] for token in query_tokens if token in self.vocabulary]
+        if not cols:
+            return np.zeros(num_docs)
+        
+        # Only chunks containing a query term contribute; all other scores stay 0
+        postings = self.term_matrix[:, cols]
+        tf = postings.data
+        rows = postings.indices
+        term_idf = np.repeat(self.idf[cols], np.diff(postings.indptr))
+        contributions = term_idf * (tf * (config.BM25_K1 + 1) / (tf + self.length_norm[rows]))
+        
+        return np.bincount(rows, weights=contributions, minlength=num_docs)
     
     def search(self, query: str, top_k: int = config.SPARSE_TOP_K) -> List[Tuple[Dict, float]]:
         """
@@ -65,43 +166,82 @@ class SparseRetriever:
         Returns:
             List of (chunk_dict, bm25_score) tuples
         """
-        if self.bm25 is None:
+        if self.term_matrix is None:
             raise ValueError("Index not built. Call build_index() first.")
         
         # Tokenize query
-        query_tokens = self.tokenize(query)
+        query_tokens = self.tokenize_query(query)
         
         # Get BM25 scores for all documents
-        scores = self.bm25.get_scores(query_tokens)
+        scores = self.get_scores(query_tokens)
         
-        # Get top-k indices
-        top_indices = scores.argsort()[-top_k:][::-1]
+        # Get top-k indices: O(N) partial selection, then sort only those k
+        top_k = min(top_k, len(scores))
+        top_indices = np.argpartition(scores, -top_k)[-top_k:]
+        top_indices = top_indices[np.argsort(-scores[top_indices])]
         
         # Prepare results
         results = []
         for rank, idx in enumerate(top_indices, 1):
-            chunk = self.chunks[idx].copy()
+            chunk = self.chunks[idx]
+            chunk['chunk_index'] = int(idx)  # Position in the chunk store (integer key for RRF)
             chunk['sparse_score'] = float(scores[idx])
             chunk['rank'] = rank
             results.append((chunk, float(scores[idx])))
         
         return results
     
+    def batch_search(self, queries: List[str], top_k: int = config.SPARSE_TOP_K, executor=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search for many queries at once, returning chunk indices and scores.
+        
+        Args:
+            queries: List of query texts
+            top_k: Number of top results per query
+            executor: Optional concurrent.futures executor used to score queries in parallel
+            
+        Returns:
+            Tuple of (indices, scores) arrays with shape (len(queries), top_k), best first
+        """
+        if self.term_matrix is None:
+            raise ValueError("Index not built. Call build_index() first.")
+        
+        # Score all queries into one (num_queries, num_chunks) matrix
+        tokenized = [self.tokenize_query(query) for query in queries]
+        map_fn = executor.map if executor is not None else map
+        scores = np.stack(list(map_fn(self.get_scores, tokenized)))
+        
+        # O(N) partial selection of the top-k, then sort only those k
+        top_k = min(top_k, scores.shape[1])
+        top_indices = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        top_scores = np.take_along_axis(scores, top_indices, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        
+        return np.take_along_axis(top_indices, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+    
     def save_index(self, index_path: str = config.BM25_INDEX_FILE):
         """
-        Save BM25 index and metadata.
+        Save BM25 index and metadata as a compressed NumPy archive.
         
         Args:
             index_path: Path to save the index
         """
-        data = {
-            'bm25': self.bm25,
-            'chunks': self.chunks,
-            'tokenized_chunks': self.tokenized_chunks
+        # Tokens never contain whitespace, so the vocabulary is one newline-joined blob
+        vocabulary = '\n'.join(self.vocabulary).encode('utf-8')
+        arrays = {
+            'term_data': self.term_matrix.data,
+            'term_indices': self.term_matrix.indices,
+            'term_indptr': self.term_matrix.indptr,
+            'term_shape': np.array(self.term_matrix.shape, dtype=np.int64),
+            'idf': self.idf,
+            'doc_len': self.doc_len.astype(np.int32),
+            'vocabulary': np.frombuffer(vocabulary, dtype=np.uint8),
+            **self.chunks.to_arrays()
         }
         
+        # Write through a file object so NumPy does not append its own extension
         with open(index_path, 'wb') as f:
-            pickle.dump(data, f)
+            np.savez_compressed(f, **arrays)
         
         print(f"BM25 index saved to {index_path}")
     
@@ -110,16 +250,47 @@ class SparseRetriever:
         Load BM25 index and metadata.
         
         Args:
-            index_path: Path to the index file
+            index_path: Path to the index file (.npz, or an older .pkl)
         """
-        with open(index_path, 'rb') as f:
-            data = pickle.load(f)
+        if index_path == config.BM25_INDEX_FILE and not os.path.exists(index_path) \
+                and os.path.exists(config.BM25_LEGACY_INDEX_FILE):
+            index_path = config.BM25_LEGACY_INDEX_FILE
         
-        self.bm25 = data['bm25']
-        self.chunks = data['chunks']
-        self.tokenized_chunks = data['tokenized_chunks']
+        if index_path.endswith('.pkl'):
+            self._load_pickle(index_path)
+        else:
+            with np.load(index_path, allow_pickle=False) as data:
+                vocabulary = data['vocabulary'].tobytes().decode('utf-8')
+                self.vocabulary = {token: col for col, token in enumerate(vocabulary.split('\n'))} if vocabulary else {}
+                self.term_matrix = sp.csc_matrix(
+                    (data['term_data'], data['term_indices'], data['term_indptr']),
+                    shape=tuple(data['term_shape'])
+                )
+                self.idf = data['idf']
+                self._set_doc_len(data['doc_len'])
+                self.chunks = ChunkStore.from_arrays(data)
         
         print(f"BM25 index loaded from {index_path}")
+    
+    def _load_pickle(self, index_path: str):
+        """
+        Load an index file pickled by older versions.
+        
+        Args:
+            index_path: Path to the .pkl index file
+        """
+        with open(index_path, 'rb') as f:
+            data = _IndexUnpickler(f).load()
+        
+        self.chunks = ChunkStore.load(data['chunks'])
+        if 'term_matrix' in data:
+            self.vocabulary = data['vocabulary']
+            self.term_matrix = data['term_matrix']
+            self.idf = data['idf']
+            self._set_doc_len(np.asarray(self.term_matrix.sum(axis=1)).ravel())
+        else:
+            # Older rank_bm25 index file: rebuild the matrix from its saved tokens
+            self._build_term_matrix(data['tokenized_chunks'])
 
 
 if __name__ == "__main__":
@@ -4,6 +4,9 @@
 import os
 import sys
 import time
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import Dict, List
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -18,30 +21,58 @@ if config.HF_TOKEN:
 from flask import Flask, render_template, request, jsonify
 import json
 
+try:
+    import orjson
+except ImportError:  # Fall back to Flask's stdlib-based jsonify
+    orjson = None
+
 from src.hybrid_retrieval import HybridRetriever
-from src.llm_generation import ResponseGenerator
+from src.llm_generation import ResponseGenerator, GenerationBatcher
 
 app = Flask(__name__)
-app.config['JSON_SORT_KEYS'] = False
+app.json.sort_keys = False  # Keep response fields in insertion order (JSON_SORT_KEYS is ignored since Flask 2.3)
 
 # Global variables for models (loaded once at startup)
 retriever = None
 generator = None
+batcher = None  # Groups concurrent requests into one generate() call
+models_status = 'loading'  # 'loading' | 'ready' | 'error' (models load in a background thread)
+
+# LRU of full search responses keyed by the normalized query
+response_cache = OrderedDict()
+response_cache_lock = threading.Lock()
+
+def cache_key(query: str) -> bytes:
+    """Cache key for a query (case and surrounding whitespace ignored)"""
+    return hashlib.blake2b(query.strip().lower().encode('utf-8'), digest_size=16).digest()
+
+def json_response(data):
+    """Serialize a (large) response body with orjson when available"""
+    if orjson is None:
+        return jsonify(data)
+    return app.response_class(orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY), mimetype='application/json')
 
 def initialize_models():
     """Load models at startup to avoid reloading on each request"""
-    global retriever, generator
+    global retriever, generator, batcher, models_status
     
     print("Loading RAG system models...")
     
     try:
-        retriever = HybridRetriever()
-        retriever.load_indices()
-        generator = ResponseGenerator()
+        loaded_retriever = HybridRetriever()
+        loaded_retriever.load_indices()
+        loaded_generator = ResponseGenerator()
+        # Publish together so requests never see a partly loaded system
+        retriever, generator = loaded_retriever, loaded_generator
+        batcher = GenerationBatcher(generator)
+        models_status = 'ready'
         print("Models loaded successfully")
         return True
     except Exception as e:
+        models_status = 'error'
         print(f"Error loading models: {e}")
+        print("Failed to load models. Make sure indices are built.")
+        print("Run: python src/hybrid_retrieval.py")
         return False
 
 @app.route('/')
@@ -60,27 +91,42 @@ def search():
         if not query:
             return jsonify({'error': 'Query is required'}), 400
         
+        if batcher is None:
+            message = 'Models are still loading' if models_status == 'loading' else 'Models failed to load'
+            return jsonify({'error': message, 'models_status': models_status}), 503
+        
+        # Repeated query: return the stored response without retrieval or generation
+        key = cache_key(query)
+        with response_cache_lock:
+            cached = response_cache.get(key)
+            if cached is not None:
+                response_cache.move_to_end(key)
+        if cached is not None:
+            return json_response(cached)
+        
         # Perform retrieval
-        retrieval_start = time.time()
+        retrieval_start = time.perf_counter()
         retrieved_chunks, metadata = retriever.search(query)
-        retrieval_time = time.time() - retrieval_start
+        retrieval_time = time.perf_counter() - retrieval_start
         
         # Generate answer
-        generation_start = time.time()
-        result = generator.generate_answer(query, retrieved_chunks)
-        generation_time = time.time() - generation_start
+        generation_start = time.perf_counter()
+        result = batcher.generate_answer(query, retrieved_chunks)
+        generation_time = time.perf_counter() - generation_start
         
         # Prepare response
-        chunks_data = []
-        for chunk, score in retrieved_chunks:
-            chunks_data.append({
+        # Fused results always carry the RRF fields, so read them directly
+        chunks_data = [
+            {
                 'title': chunk['title'],
                 'url': chunk['url'],
                 'text': chunk['text'],
-                'rrf_score': chunk.get('rrf_score', 0),
-                'dense_rank': chunk.get('dense_rank'),
-                'sparse_rank': chunk.get('sparse_rank')
-            })
+                'rrf_score': rrf_score,
+                'dense_rank': chunk['dense_rank'],
+                'sparse_rank': chunk['sparse_rank']
+            }
+            for chunk, rrf_score in retrieved_chunks
+        ]
         
         response = {
             'query': query,
@@ -91,26 +137,40 @@ def search():
             'chunks': chunks_data
         }
         
-        return jsonify(response)
+        with response_cache_lock:
+            response_cache[key] = response
+            if len(response_cache) > config.UI_CACHE_SIZE:
+                response_cache.popitem(last=False)
+        
+        return json_response(response)
         
     except Exception as e:
         print(f"Search error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/cache/clear', methods=['POST'])
+def clear_cache():
+    """Drop cached search responses and generated answers"""
+    with response_cache_lock:
+        cleared = len(response_cache)
+        response_cache.clear()
+    if generator is not None:
+        generator.clear_cache()
+    return jsonify({'status': 'ok', 'cleared': cleared})
+
 @app.route('/health')
 def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'ok',
-        'models_loaded': retriever is not None and generator is not None
+        'models_loaded': batcher is not None,
+        'models_status': models_status
     })
 
 if __name__ == '__main__':
-    # Initialize models before starting server
-    if not initialize_models():
-        print("Failed to load models. Make sure indices are built.")
-        print("Run: python src/hybrid_retrieval.py")
-        sys.exit(1)
+    # Load models in the background so the server (and /health) answers immediately;
+    # /api/search returns 503 until loading has finished
+    threading.Thread(target=initialize_models, name="model-loader", daemon=True).start()
     
     # Start Flask server
     print(f"Starting server on {config.UI_HOST}:{config.UI_PORT}")
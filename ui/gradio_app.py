@@ -1,6 +1,7 @@
 import os
 import sys
 import time
+import threading
 from typing import List, Tuple
 
 # Fix imports for local development
@@ -20,25 +21,32 @@ from src.llm_generation import ResponseGenerator
 # Global instances
 retriever = None
 generator = None
+load_error = None  # Set if background model loading failed
 
 def initialize_models():
     """Application startup initialization"""
-    global retriever, generator
+    global retriever, generator, load_error
     
     print("Loading RAG system models for Gradio...")
     try:
-        retriever = HybridRetriever()
-        retriever.load_indices()
-        generator = ResponseGenerator()
+        loaded_retriever = HybridRetriever()
+        loaded_retriever.load_indices()
+        loaded_generator = ResponseGenerator()
+        # Publish together so respond() never sees a partly loaded system
+        retriever, generator = loaded_retriever, loaded_generator
         print("Models loaded successfully")
         return True
     except Exception as e:
+        load_error = str(e)
         print(f"Error loading models: {e}")
+        print("Failed to initialize system. Please ensure indices are built (run src/hybrid_retrieval.py).")
         return False
 
 def respond(message, history):
     """Handle chat messages"""
     if retriever is None or generator is None:
+        if load_error is not None:
+            return f"System failed to load models: {load_error}"
         return "System is still initializing models. Please wait a moment."
     
     try:
@@ -49,19 +57,19 @@ def respond(message, history):
         result = generator.generate_answer(message, retrieved_chunks)
         answer = result['answer']
         
-        # Format sources
-        sources = "\n\n**Sources:**\n"
-        seen_urls = set()
+        # Format sources, one line per distinct source (by URL, else by title)
+        source_lines = []
+        seen_sources = set()
         for chunk, _ in retrieved_chunks:
             url = chunk.get('url', '')
             title = chunk.get('title', 'Unknown Source')
-            if url and url not in seen_urls:
-                sources += f"- [{title}]({url})\n"
-                seen_urls.add(url)
-            elif title and title not in seen_urls:
-                sources += f"- {title}\n"
-                seen_urls.add(title)
+            source_key = url or title
+            if not source_key or source_key in seen_sources:
+                continue
+            seen_sources.add(source_key)
+            source_lines.append(f"- [{title}]({url})" if url else f"- {title}")
         
+        sources = "\n\n**Sources:**\n" + "".join(line + "\n" for line in source_lines)
         return answer + sources
     except Exception as e:
         return f"Error: {str(e)}"
@@ -78,8 +86,10 @@ with gr.Blocks(title="Hybrid RAG Chatbot") as demo:
     )
 
 if __name__ == "__main__":
-    if initialize_models():
-        # Launch with sharing enabled
-        demo.launch(share=True, server_name=config.UI_HOST, server_port=config.UI_PORT + 1)
-    else:
-        print("Failed to initialize system. Please ensure indices are built (run src/hybrid_retrieval.py).")
+    # Load models in the background so the UI is served immediately;
+    # respond() answers with a loading message until they are ready
+    threading.Thread(target=initialize_models, name="model-loader", daemon=True).start()
+    
+    # Launch with sharing enabled
+    demo.queue()
+    demo.launch(share=True, server_name=config.UI_HOST, server_port=config.UI_PORT + 1)